@@ -1,6 +1,6 @@
 # services/extractor/app/config.py
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -9,22 +9,67 @@ class Settings(BaseSettings):
     # Qdrant
     QDRANT_URL: str = "http://localhost:6333"
     QDRANT_COLLECTION: str = "university_documents"
+    # HNSW/quantization profile for new collections: "default", "balanced" or "compact"
+    # (see app/utils/qdrant_profiles.py; keep in sync with the server)
+    COLLECTION_PROFILE: str = "default"  # opt in to "balanced"/"compact" for large corpora
 
     # Ollama/Embeddings
+    SENTENCE_TRANSFORMER_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # "torch", "onnx" or "onnx-int8" (ONNX Runtime, CPU)
+    EMBEDDING_ONNX_INT8_FILE: str = "onnx/model_qint8_avx2.onnx"  # quantized file in the model repo
+    EMBEDDING_PARITY_MIN_COSINE: float = 0.99  # check-backend fails below this vs torch
     OLLAMA_URL: str = "http://localhost:11434"
     EMBEDDING_MODEL: str = "all-minilm"
     EMBEDDING_DIM: int = 384
     EMBEDDING_BATCH_SIZE: int = 4 #8
+    # Process command: chunks from many files are pooled and encoded together
+    GLOBAL_EMBEDDING_BATCH_SIZE: int = 64  # texts per forward pass
+    GLOBAL_BATCH_MAX_CHUNKS: int = 1024  # chunks pooled before encoding
+
+    # Hybrid search: BM25 sparse vectors stored next to the dense ones
+    SPARSE_VECTORS: bool = True
+    SPARSE_VECTOR_NAME: str = "bm25"
+
+    # Payload fields indexed for filtered search (source/file_hash also serve stale-point cleanup)
+    PAYLOAD_KEYWORD_INDEXES: List[str] = ["source", "filename", "file_type", "faculty", "file_hash"]
+    PAYLOAD_INTEGER_INDEXES: List[str] = ["chunk_index"]
 
     # Processing
     CHUNK_SIZE: int = 500 #1000
     CHUNK_OVERLAP: int = 200
+    CHUNKING_MODE: str = "chars"  # "chars" or "tokens" (sized by the embedding model's tokenizer)
+    CHUNK_OVERLAP_TOKENS: int = 32
     BATCH_SIZE: int = 2 #100
 
+    # Bulk mode (process --bulk): parallel uploads over gRPC, HNSW indexing paused until the end
+    QDRANT_PREFER_GRPC: bool = True
+    QDRANT_GRPC_PORT: int = 6334
+    BULK_UPLOAD_PARALLEL: int = 4  # upload processes
+    BULK_UPLOAD_BATCH_SIZE: int = 256  # points per request
+    BULK_FLUSH_POINTS: int = 4096  # points gathered across files per upload call
+    INDEXING_THRESHOLD: int = 20000  # KB; restored after bulk runs (Qdrant's default)
+
+    # Pipeline (process command)
+    EXTRACT_WORKERS: int = max(1, (os.cpu_count() or 2) - 1)
+    EMBED_WORKERS: int = 1
+    PIPELINE_QUEUE_SIZE: int = 8  # files buffered between stages
+
+    # OCR
+    OCR_WORKERS: int = 2  # parallel tesseract processes per document
+    OCR_PAGE_WINDOW: int = 8  # max rendered pages held in memory at once
+    OCR_DPI: int = 200
+    # A PDF page is OCRed only when its text layer is this sparse (chars per square inch)...
+    OCR_MAX_TEXT_DENSITY: float = 2.0
+    # ...and images cover at least this fraction of it
+    OCR_MIN_IMAGE_COVERAGE: float = 0.5
+
     # Paths - SET YOUR FOLDER PATHS HERE
     INPUT_DIR: str = "app/data/input"  # CHANGE THIS LINE
     PROCESSED_DIR: str = "app/data/processed"   # CHANGE THIS LINE
     ERROR_LOG_DIR: str = "app/data/errors"  # CHANGE THIS LINE
+    OCR_CACHE_DIR: str = "app/data/ocr_cache"  # OCR text keyed by page hash
+    MANIFEST_PATH: str = "app/data/manifest.sqlite3"  # content hashes of ingested files
+    MOVE_PROCESSED: bool = True  # move ingested files to PROCESSED_DIR
 
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -1,32 +1,89 @@
 # services/extractor/app/embed.py
-import gc
 import numpy as np
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 import logging
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from app.utils.idgen import generate_id
+from app.utils.idgen import generate_chunk_id
+from app.utils import bm25
+from app.utils.qdrant_profiles import get_profile, collection_config
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Mixed-length sample of the kind of text we index, for backend parity checks
+PARITY_SAMPLE_TEXTS = [
+    "test",
+    "Orario delle lezioni del corso di laurea in Ingegneria Informatica",
+    "How do I register for the final exam of CS-214?",
+    "Le domande di iscrizione devono essere presentate entro il 30 settembre tramite il portale studenti.",
+    "The scholarship is awarded on the basis of merit and family income (ISEE); "
+    "students must maintain at least 40 ECTS credits per academic year to keep it.",
+    "Regolamento didattico: gli studenti che non superano l'esame possono ripeterlo nella sessione "
+    "successiva, previa prenotazione online almeno sette giorni prima della data dell'appello. "
+    "Per informazioni rivolgersi alla segreteria studenti.",
+]
+
+
+def load_sentence_transformer(model_name: str, backend: str = settings.EMBEDDING_BACKEND):
+    """Load a SentenceTransformer on CPU with the requested inference backend
+
+    "onnx" runs the exported fp32 graph in ONNX Runtime, "onnx-int8" the
+    dynamically quantized graph shipped in the model repo.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": settings.EMBEDDING_ONNX_INT8_FILE})
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+
+
+def check_backend_parity(model_name: str, backend: str,
+                         texts: List[str] = PARITY_SAMPLE_TEXTS) -> Dict[str, float]:
+    """Compare a backend's vectors with the PyTorch reference by cosine similarity"""
+    reference = load_sentence_transformer(model_name, "torch").encode(texts, normalize_embeddings=True)
+    candidate = load_sentence_transformer(model_name, backend).encode(texts, normalize_embeddings=True)
+    cosines = np.sum(reference * candidate, axis=1)
+    return {"min_cosine": float(cosines.min()), "mean_cosine": float(cosines.mean())}
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield lists of up to size items from any iterable"""
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 class EmbeddingGenerator:
     """Generate embeddings for text documents and store in Qdrant"""
 
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = settings.SENTENCE_TRANSFORMER_MODEL,
+                 backend: str = settings.EMBEDDING_BACKEND):
         self.model_name = model_name
+        self.backend = backend
         self.model = None
         self.qdrant_client = QdrantClient(settings.QDRANT_URL)
         self.embedding_dim = 384  # all-MiniLM-L6-v2 dimension
+        # Switched off for collections created before sparse vectors existed
+        self.sparse_enabled = settings.SPARSE_VECTORS
+        # gRPC client for bulk uploads, created on first use
+        self.bulk_client = None
 
     def load_model(self):
         """Load the embedding model"""
         try:
-            from sentence_transformers import SentenceTransformer
-            # removing device could make it work for GPU be default
-            self.model = SentenceTransformer(self.model_name, device="cpu")
+            self.model = load_sentence_transformer(self.model_name, self.backend)
             self.embedding_dim = self.model.get_sentence_embedding_dimension()
-            logger.info(f"Loaded embedding model: {self.model_name}, dimension: {self.embedding_dim}")
+            logger.info(f"Loaded embedding model: {self.model_name} ({self.backend}), dimension: {self.embedding_dim}")
         except Exception as e:
         #except ImportError:
             #logger.error("sentence-transformers not available. Please install: pip install sentence-transformers")
@@ -73,77 +130,307 @@ class EmbeddingGenerator:
             logger.error(f"Error generating batch embeddings: {e}")
             raise
 
+    def generate_embeddings_grouped(self, groups: List[List[str]],
+                                    batch_size: int = settings.GLOBAL_EMBEDDING_BATCH_SIZE,
+                                    as_arrays: bool = False) -> List[Any]:
+        """Embed texts from many files together and return the vectors per file
+
+        All texts are sorted by length before batching, so every forward pass
+        holds texts of similar length and wastes little on padding. With
+        as_arrays each file gets a float32 array instead of lists.
+        """
+        if self.model is None:
+            self.load_model()
+
+        texts = [text for group in groups for text in group]
+        order = np.argsort([len(text) for text in texts], kind="stable")
+
+        vectors = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            vectors[bucket] = self.model.encode([texts[i] for i in bucket], batch_size=len(bucket))
+
+        # Scatter back to the owning files
+        grouped = []
+        offset = 0
+        for group in groups:
+            file_vectors = vectors[offset:offset + len(group)]
+            grouped.append(file_vectors if as_arrays else file_vectors.tolist())
+            offset += len(group)
+        return grouped
+
     # CHANGED: Removed async, fixed parameter signature
-    def process_chunks(self, chunks: List[Dict[str, Any]], metadata: Dict[str, Any]) -> bool:
-        """Process chunks and store in Qdrant - SYNCHRONOUS VERSION"""
+    def process_chunks(self, chunks: Iterable[Dict[str, Any]], metadata: Dict[str, Any]) -> int:
+        """Process chunks and store in Qdrant - SYNCHRONOUS VERSION
+
+        Chunks are consumed one embedding batch at a time, so a stream from
+        DocumentProcessor.iter_file_chunks is never held in memory as a whole.
+        Returns the number of chunks stored, 0 on failure.
+        """
         try:
             collection_name = metadata.get("collection", settings.QDRANT_COLLECTION)
             source = metadata.get("file_path", "unknown")
+            file_hash = metadata["file_hash"]
             batch_size = metadata.get("batch_size", settings.BATCH_SIZE)
             #specific for smaller cpu load
             # Safe embedding batch size (separate from Qdrant upload)
             embedding_batch_size = metadata.get("embedding_batch_size", settings.EMBEDDING_BATCH_SIZE)
 
-            logger.info(f"Processing {len(chunks)} chunks for collection: {collection_name}")
+            logger.info(f"Processing chunks of {source} for collection: {collection_name}")
 
             # Ensure collection exists
             self._ensure_collection(collection_name)
 
-            # Extract text from chunks for embedding
-            texts = [chunk["text"] for chunk in chunks]
-
-            # Generate embeddings in batch
-            logger.info("Generating embeddings...")
-            embeddings = self.generate_embeddings_batch(texts, batch_size=embedding_batch_size)
-            logger.info(f"Generated {len(embeddings)} embeddings")
+            stored = 0
+            # Double buffering: batch N is upserted while batch N+1 is being embedded
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="qdrant-upload") as uploader:
+                in_flight = None
+                for batch in _batched(chunks, embedding_batch_size):
+                    # Extract text from chunks for embedding
+                    texts = [chunk["text"] for chunk in batch]
+                    embeddings = self.generate_embeddings_batch(texts, batch_size=embedding_batch_size)
+                    points = self.build_points(batch, embeddings, source, file_hash)
 
-            # Prepare points for Qdrant
-            points = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                point = models.PointStruct(
-                    id=generate_id(),
-                    vector=embedding,
-                    payload={
-                        "text": chunk["text"],
-                        "source": source,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks),
-                        "filename": chunk["metadata"]["filename"],
-                        "file_type": chunk["metadata"]["file_type"],
-                        "file_size": chunk["metadata"]["file_size"]
-                    }
-                )
-                points.append(point)
-
-            # Upload to Qdrant in batches to avoid memory issues
-            logger.info(f"Uploading {len(points)} points to Qdrant in batches of {batch_size}...")
-
-            for i in range(0, len(points), batch_size):
-                batch = points[i:i + batch_size]
-                try:
-                    operation_info = self.qdrant_client.upsert(
-                        collection_name=collection_name,
-                        points=batch,
-                        wait=True  # Wait for confirmation
+                    if in_flight is not None and not in_flight.result():
+                        return 0
+                    in_flight = uploader.submit(
+                        self.upload_points, points, collection_name, batch_size, False
                     )
-                    logger.info(f"✅ Uploaded batch {i//batch_size + 1}/{(len(points)-1)//batch_size + 1}")
-                except Exception as e:
-                    logger.error(f"❌ Failed to upload batch {i//batch_size + 1}: {str(e)}")
-                    return False
-                finally:
-                    # 🧹 Cleanup memory after each batch
-                    del batch
-                    gc.collect()
-                    if torch.cuda.is_available():
-                        torch.cuda.empty_cache()
-
-            logger.info(f"✅ Successfully processed {len(points)} chunks from {source}")
-            return True
+                    stored += len(points)
+
+                if in_flight is not None and not in_flight.result():
+                    return 0
+
+            if not stored:
+                logger.warning(f"No content extracted from {source}")
+                return 0
+
+            # Only known once the stream has ended; waited on, so it is also the
+            # barrier for the unacknowledged upserts before it
+            self._set_total_chunks(collection_name, file_hash, stored)
+
+            logger.info(f"✅ Successfully processed {stored} chunks from {source}")
+            return stored
 
         except Exception as e:
             logger.error(f"❌ Chunk processing failed: {str(e)}")
+            return 0
+
+    def _set_total_chunks(self, collection_name: str, file_hash: str, total_chunks: int):
+        self.qdrant_client.set_payload(
+            collection_name=collection_name,
+            payload={"total_chunks": total_chunks},
+            points=[generate_chunk_id(file_hash, i) for i in range(total_chunks)],
+            wait=True
+        )
+
+    def build_points(self, chunks: List[Dict[str, Any]], embeddings: List[List[float]],
+                     source: str, file_hash: str) -> List[models.PointStruct]:
+        """Prepare Qdrant points for the chunks of one file"""
+        points = []
+        for chunk, embedding in zip(chunks, embeddings):
+            chunk_index = chunk["metadata"]["chunk_index"]
+            point = models.PointStruct(
+                # Derived from content, so re-ingesting a file overwrites its points
+                id=generate_chunk_id(file_hash, chunk_index),
+                vector=self._point_vector(chunk["text"], embedding),
+                payload=self._payload(chunk, source, file_hash)
+            )
+            points.append(point)
+        return points
+
+    def _payload(self, chunk: Dict[str, Any], source: str, file_hash: str) -> Dict[str, Any]:
+        return {
+            "text": chunk["text"],
+            "source": source,
+            "file_hash": file_hash,
+            "chunk_index": chunk["metadata"]["chunk_index"],
+            # Absent for streamed chunks until the whole file is stored
+            "total_chunks": chunk["metadata"].get("total_chunks"),
+            "filename": chunk["metadata"]["filename"],
+            "file_type": chunk["metadata"]["file_type"],
+            "faculty": chunk["metadata"].get("faculty"),
+            "file_size": chunk["metadata"]["file_size"],
+            "char_start": chunk["metadata"]["char_start"],
+            "char_end": chunk["metadata"]["char_end"]
+        }
+
+    def _point_vector(self, text: str, embedding: List[float]):
+        """Dense vector alone, or with the chunk's BM25 sparse vector for hybrid search"""
+        if not self.sparse_enabled:
+            return embedding
+        vector = {"": embedding}
+        indices, values = bm25.document_vector(text)
+        if indices:
+            vector[settings.SPARSE_VECTOR_NAME] = models.SparseVector(indices=indices, values=values)
+        return vector
+
+    def upload_points(self, points: List[models.PointStruct], collection_name: str, batch_size: int,
+                      wait_last: bool = True) -> bool:
+        """Upload points to Qdrant in batches to avoid memory issues
+
+        Batches are sent without waiting for them to be applied. Qdrant applies
+        a collection's updates in order, so waiting on the last batch
+        (wait_last) is a barrier for the whole upload.
+        """
+        logger.info(f"Uploading {len(points)} points to Qdrant in batches of {batch_size}...")
+
+        batch_count = (len(points) - 1) // batch_size + 1
+        for i in range(0, len(points), batch_size):
+            is_last = i + batch_size >= len(points)
+            try:
+                self.qdrant_client.upsert(
+                    collection_name=collection_name,
+                    points=points[i:i + batch_size],
+                    wait=wait_last and is_last
+                )
+                logger.debug(f"Uploaded batch {i//batch_size + 1}/{batch_count}")
+            except Exception as e:
+                logger.error(f"❌ Failed to upload batch {i//batch_size + 1}: {str(e)}")
+                return False
+
+        logger.info(f"✅ Uploaded {len(points)} points in {batch_count} batches")
+        return True
+
+    def _get_bulk_client(self) -> QdrantClient:
+        # gRPC carries the vectors as packed floats instead of JSON numbers
+        if self.bulk_client is None:
+            self.bulk_client = QdrantClient(settings.QDRANT_URL, prefer_grpc=settings.QDRANT_PREFER_GRPC,
+                                            grpc_port=settings.QDRANT_GRPC_PORT, timeout=60)
+        return self.bulk_client
+
+    def upload_bulk(self, files: List[Tuple[List[Dict[str, Any]], np.ndarray, str, str]], collection_name: str,
+                    parallel: int = settings.BULK_UPLOAD_PARALLEL,
+                    batch_size: int = settings.BULK_UPLOAD_BATCH_SIZE) -> bool:
+        """Upload the chunks of several files in one parallel upload_collection call
+
+        files holds (chunks, embeddings array, source, file_hash) per file. The
+        dense vectors go out as one contiguous float32 array, sliced into
+        requests by the client. Sparse vectors cannot ride in an array, so
+        they follow in batched update_vectors calls.
+        """
+        ids, payloads = [], []
+        for chunks, _, source, file_hash in files:
+            for chunk in chunks:
+                ids.append(generate_chunk_id(file_hash, chunk["metadata"]["chunk_index"]))
+                payloads.append(self._payload(chunk, source, file_hash))
+
+        vectors = np.ascontiguousarray(np.vstack([embeddings for _, embeddings, _, _ in files]), dtype=np.float32)
+
+        try:
+            client = self._get_bulk_client()
+            client.upload_collection(
+                collection_name=collection_name,
+                vectors=vectors,
+                payload=payloads,
+                ids=ids,
+                batch_size=batch_size,
+                parallel=parallel,
+                # Qdrant applies updates in order: waiting makes the stale-point cleanup that follows safe
+                wait=True
+            )
+            if self.sparse_enabled:
+                self._upload_sparse_vectors(client, collection_name, ids, payloads, batch_size)
+        except Exception as e:
+            logger.error(f"❌ Bulk upload of {len(ids)} points failed: {str(e)}")
             return False
 
+        logger.info(f"✅ Bulk uploaded {len(ids)} points from {len(files)} files ({parallel} workers)")
+        return True
+
+    def _upload_sparse_vectors(self, client: QdrantClient, collection_name: str, ids: List[str],
+                               payloads: List[Dict[str, Any]], batch_size: int):
+        """Attach BM25 vectors to points just uploaded with their dense vectors"""
+        for start in range(0, len(ids), batch_size):
+            points = []
+            for point_id, payload in zip(ids[start:start + batch_size], payloads[start:start + batch_size]):
+                indices, values = bm25.document_vector(payload["text"])
+                if indices:
+                    points.append(models.PointVectors(
+                        id=point_id,
+                        vector={settings.SPARSE_VECTOR_NAME: models.SparseVector(indices=indices, values=values)}
+                    ))
+            if points:
+                # Only the last batch is waited on; updates are applied in order
+                client.update_vectors(collection_name=collection_name, points=points,
+                                      wait=start + batch_size >= len(ids))
+
+    def suspend_indexing(self, collection_name: str) -> Optional[int]:
+        """Stop building the HNSW index while a bulk load runs; returns the threshold to restore
+
+        Points are still searchable (by brute force on unindexed segments) and
+        the graph is built once at the end rather than rebuilt on every flush.
+        A threshold of 0 found here was left by an interrupted bulk run and is
+        not worth restoring, so INDEXING_THRESHOLD is returned instead.
+        """
+        optimizer_config = self.qdrant_client.get_collection(collection_name).config.optimizer_config
+        previous = optimizer_config.indexing_threshold or settings.INDEXING_THRESHOLD
+        self.qdrant_client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=0)
+        )
+        logger.info(f"⏸️ HNSW indexing paused on {collection_name} (will restore {previous})")
+        return previous
+
+    def resume_indexing(self, collection_name: str, indexing_threshold: Optional[int] = None):
+        """Restore the indexing threshold; Qdrant then indexes the loaded points in the background"""
+        threshold = indexing_threshold or settings.INDEXING_THRESHOLD
+        self.qdrant_client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=models.OptimizersConfigDiff(indexing_threshold=threshold)
+        )
+        logger.info(f"▶️ HNSW indexing resumed on {collection_name} (threshold {threshold})")
+
+    def delete_file_points(self, collection_name: str, source: str, keep_hash: str,
+                           old_hash: Optional[str] = None, old_chunk_count: int = 0,
+                           old_hash_shared: bool = False, new_chunk_count: Optional[int] = None):
+        """Remove points left over from an earlier version of a file
+
+        old_hash_shared means an identical copy elsewhere still owns the old
+        points (IDs depend only on content), so they are kept. new_chunk_count
+        is the number of chunks just stored: the same content re-chunked into
+        fewer pieces (new chunk size, overlap or mode) leaves higher indexes behind.
+        """
+        if new_chunk_count is not None and (old_hash in (None, keep_hash)) \
+                and not (old_hash == keep_hash and old_chunk_count <= new_chunk_count):
+            self.qdrant_client.delete(
+                collection_name=collection_name,
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(must=[
+                        models.FieldCondition(key="source", match=models.MatchValue(value=source)),
+                        models.FieldCondition(key="file_hash", match=models.MatchValue(value=keep_hash)),
+                        models.FieldCondition(key="chunk_index", range=models.Range(gte=new_chunk_count)),
+                    ])
+                ),
+                wait=True
+            )
+
+        if old_hash:
+            if old_hash == keep_hash:
+                return
+            if old_hash_shared:
+                logger.info(f"Keeping previous points of {source}: another file has the same content")
+                return
+            # Known previous version: its point IDs can be recomputed directly
+            selector = models.PointIdsList(
+                points=[generate_chunk_id(old_hash, i) for i in range(old_chunk_count)]
+            )
+        else:
+            # Unknown history (e.g. ingested before the manifest existed)
+            selector = models.FilterSelector(
+                filter=models.Filter(
+                    must=[models.FieldCondition(key="source", match=models.MatchValue(value=source))],
+                    must_not=[models.FieldCondition(key="file_hash", match=models.MatchValue(value=keep_hash))],
+                )
+            )
+
+        self.qdrant_client.delete(
+            collection_name=collection_name,
+            points_selector=selector,
+            wait=True
+        )
+        logger.info(f"🧹 Removed stale points for {source}")
+
     # CHANGED: Removed async
     def _ensure_collection(self, collection_name: str):
         """Ensure Qdrant collection exists - SYNCHRONOUS VERSION"""
@@ -152,22 +439,52 @@ class EmbeddingGenerator:
             existing_collections = [col.name for col in collections.collections]
             
             if collection_name not in existing_collections:
-                logger.info(f"Creating collection: {collection_name}")
+                logger.info(f"Creating collection: {collection_name} ({settings.COLLECTION_PROFILE} profile)")
                 self.qdrant_client.create_collection(
                     collection_name=collection_name,
-                    vectors_config=models.VectorParams(
-                        size=self.embedding_dim,
-                        distance=models.Distance.COSINE
-                    )
+                    **collection_config(get_profile(settings.COLLECTION_PROFILE), self.embedding_dim),
+                    sparse_vectors_config={
+                        settings.SPARSE_VECTOR_NAME: models.SparseVectorParams()
+                    } if self.sparse_enabled else None
                 )
                 logger.info(f"✅ Created collection: {collection_name}")
+                self._ensure_payload_indexes(collection_name, set())
             else:
                 logger.info(f"✅ Collection exists: {collection_name}")
+                info = self.qdrant_client.get_collection(collection_name)
+                if self.sparse_enabled:
+                    sparse_config = info.config.params.sparse_vectors
+                    if not sparse_config or settings.SPARSE_VECTOR_NAME not in sparse_config:
+                        # Sparse vectors cannot be added to an existing collection
+                        logger.warning(f"Collection {collection_name} has no '{settings.SPARSE_VECTOR_NAME}' sparse "
+                                       f"vectors; storing dense vectors only. Recreate it to enable hybrid search.")
+                        self.sparse_enabled = False
+                # Collections created before the indexes existed get them now
+                self._ensure_payload_indexes(collection_name, set(info.payload_schema or {}))
+                if info.config.optimizer_config.indexing_threshold == 0:
+                    # A bulk run killed before it could restore indexing; bulk runs pause it again
+                    logger.warning(f"HNSW indexing on {collection_name} was left paused; resuming it")
+                    self.resume_indexing(collection_name)
                 
         except Exception as e:
             logger.error(f"❌ Collection creation failed: {str(e)}")
             raise
 
+    def _ensure_payload_indexes(self, collection_name: str, existing: set):
+        """Index the payload fields that searches filter on, so filters don't scan every point"""
+        wanted = [(field, models.PayloadSchemaType.KEYWORD) for field in settings.PAYLOAD_KEYWORD_INDEXES]
+        wanted += [(field, models.PayloadSchemaType.INTEGER) for field in settings.PAYLOAD_INTEGER_INDEXES]
+        for field, schema in wanted:
+            if field in existing:
+                continue
+            self.qdrant_client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field,
+                field_schema=schema,
+                wait=True
+            )
+            logger.info(f"✅ Created {schema.value} payload index: {collection_name}.{field}")
+
     # CHANGED: Removed async
     def check_qdrant_health(self) -> bool:
         """Check if Qdrant is accessible - SYNCHRONOUS VERSION"""
@@ -1,26 +1,73 @@
 # services/extractor/app/extract.py
 import os
+import hashlib
+import json
+import posixpath
+import zipfile
+from xml.etree import ElementTree
 import fitz  # PyMuPDF
-from pptx import Presentation
-from docx import Document
 import pdf2image
 import pytesseract
 from PIL import Image
-import io
 import nltk
 from nltk.tokenize import sent_tokenize
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, NamedTuple, Optional, Tuple
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from app.config import settings
+from app.ocr_cache import OcrCache
+from app.manifest import file_sha256
 
 logger = logging.getLogger(__name__)
 
+# Extracted text is handed to the chunker in segments of about this many characters
+_SEGMENT_CHARS = 64 * 1024
+
+# Office Open XML namespaces
+_W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_A_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_P_NS = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+_R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# Run-level elements that python-docx renders as whitespace
+_W_BREAKS = {f"{_W_NS}tab": "\t", f"{_W_NS}br": "\n", f"{_W_NS}cr": "\n"}
+
+
+class TextChunk(NamedTuple):
+    """A piece of extracted text with its character span in the source text"""
+    text: str
+    char_start: int
+    char_end: int
+
+
+def faculty_for(file_path: Path, base_dir: Optional[str]) -> Optional[str]:
+    """Top-level folder of a file under the input directory, used as its faculty tag
+
+    Files directly in base_dir, or outside it, have no faculty.
+    """
+    if not base_dir:
+        return None
+    try:
+        parts = Path(file_path).resolve().relative_to(Path(base_dir).resolve()).parts
+    except ValueError:
+        return None
+    return parts[0] if len(parts) > 1 else None
+
+
 class DocumentProcessor:
-    def __init__(self):
+    def __init__(self, chunking_mode: str = settings.CHUNKING_MODE):
         self.supported_extensions = {
             '.pdf', '.docx', '.pptx', '.txt', 
             '.jpg', '.jpeg', '.png',
         }
+        self.ocr_cache = OcrCache()
+        if chunking_mode not in ("chars", "tokens"):
+            raise ValueError(f"Unsupported chunking mode: {chunking_mode}")
+        self.chunking_mode = chunking_mode
+        self._token_counter = None
     
     def find_supported_files(self, directory: str) -> List[Path]:
         """Find all supported files in directory"""
@@ -41,209 +88,512 @@ class DocumentProcessor:
         # Remove duplicates and return
         return list(set(files))
     
-    def process_file(self, file_path: str, chunk_size: int = 1000) -> List[Dict[str, Any]]:
+    def process_file(self, file_path: str, chunk_size: int = 1000,
+                     chunk_overlap: int = settings.CHUNK_OVERLAP,
+                     base_dir: Optional[str] = None) -> List[Dict[str, Any]]:
         """Process a file and return text chunks with metadata - SYNCHRONOUS"""
+        chunks = list(self.iter_file_chunks(file_path, chunk_size, chunk_overlap, base_dir))
+        
+        if not chunks:
+            logger.warning(f"No text extracted from {file_path}")
+            return []
+        
+        for chunk in chunks:
+            chunk["metadata"]["total_chunks"] = len(chunks)
+        return chunks
+
+    def iter_file_chunks(self, file_path: str, chunk_size: int = 1000,
+                         chunk_overlap: int = settings.CHUNK_OVERLAP,
+                         base_dir: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Stream text chunks with metadata while the file is still being extracted
+
+        total_chunks is unknown until the stream ends and is left out of the metadata.
+        base_dir is the input directory the faculty tag is derived from.
+        """
         path = Path(file_path)
         
         if not path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
         
-        # Extract text - CHANGED: Direct call
-        text = self.extract_text_from_file(path)
-        
-        if not text.strip():
-            logger.warning(f"No text extracted from {file_path}")
-            return []
+        segments = self.iter_segments(path)
         
         # Chunk text
-        chunks = self._chunk_text(text, chunk_size)
+        if self.chunking_mode == "tokens":
+            # Pack up to the model's real input length instead of a character count
+            token_counter = self._get_token_counter()
+            chunks = self.iter_chunks(segments, token_counter.max_tokens,
+                                      settings.CHUNK_OVERLAP_TOKENS, token_counter)
+        else:
+            chunks = self.iter_chunks(segments, chunk_size, chunk_overlap)
         
-        return [
-            {
-                "text": chunk,
+        file_size = path.stat().st_size
+        faculty = faculty_for(path, base_dir)
+        for i, chunk in enumerate(chunks):
+            yield {
+                "text": chunk.text,
                 "metadata": {
                     "filename": path.name,
                     "file_path": str(path),
-                    "file_size": path.stat().st_size,
+                    "file_size": file_size,
                     "chunk_index": i,
-                    "total_chunks": len(chunks),
-                    "file_type": path.suffix.lower()
+                    "file_type": path.suffix.lower(),
+                    "faculty": faculty,
+                    "char_start": chunk.char_start,
+                    "char_end": chunk.char_end
                 }
             }
-            for i, chunk in enumerate(chunks)
-        ]
 
     def extract_text_from_file(self, file_path: Path) -> str:
         """Extract text from file path"""
+        return "".join(self.iter_segments(file_path))
+
+    def iter_segments(self, file_path: Path) -> Iterator[str]:
+        """Yield extracted text one page, slide or paragraph block at a time"""
         suffix = file_path.suffix.lower()
         
+        if suffix == '.pdf':
+            extractor = self._iter_pdf
+        elif suffix == '.docx':
+            extractor = self._iter_docx
+        elif suffix == '.pptx':
+            extractor = self._iter_pptx
+        elif suffix == '.txt':
+            extractor = self._iter_txt
+        elif suffix in ('.jpg', '.jpeg', '.png'):
+            extractor = self._iter_image
+        else:
+            raise ValueError(f"Unsupported file format: {suffix}")
+        
         try:
-            with open(file_path, 'rb') as f:
-                content = f.read()
-            
-            if suffix == '.pdf':
-                return self._extract_from_pdf(content)
-            elif suffix == '.docx':
-                return self._extract_from_docx(content)
-            elif suffix == '.pptx':
-                return self._extract_from_pptx(content)
-            elif suffix == '.txt':
-                return content.decode('utf-8', errors='ignore')
-            elif suffix in ('.jpg', '.jpeg', '.png'):
-                return self._extract_from_image(content)
-            else:
-                raise ValueError(f"Unsupported file format: {suffix}")
-                
+            yield from extractor(file_path)
         except Exception as e:
             logger.error(f"Error extracting from {file_path}: {str(e)}")
             raise
     
-    def _extract_from_pdf(self, content: bytes) -> str:
-        """Extract text from PDF with OCR fallback"""
+    def _iter_pdf(self, path: Path) -> Iterator[str]:
+        """Yield PDF text page by page, OCRing only the pages without a usable text layer"""
         try:
-            # Method 1: Direct text extraction using PyMuPDF
-            doc = fitz.open(stream=content, filetype="pdf")
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            
-            # If no text found or very little text, try OCR
-            if not text.strip() or len(text.strip()) < 50:
-                ocr_text = self._ocr_pdf(content)
-                if ocr_text.strip():
-                    text = ocr_text
-                
-            return text
-            
+            # Opened by path: PyMuPDF reads pages on demand instead of holding a bytes copy
+            doc = fitz.open(str(path))
         except Exception as e:
             logger.error(f"PDF extraction failed: {str(e)}")
             # Try OCR as fallback
-            try:
-                return self._ocr_pdf(content)
-            except Exception as ocr_error:
-                logger.error(f"PDF OCR also failed: {ocr_error}")
-                raise e
-    
-    def _ocr_pdf(self, content: bytes) -> str:
-        """OCR for PDFs without embedded text"""
+            yield from self._iter_ocr_pdf(path)
+            return
+
         try:
-            images = pdf2image.convert_from_bytes(content)
-            text = ""
-            for i, image in enumerate(images):
-                logger.info(f"OCR processing page {i+1}/{len(images)}")
-                page_text = pytesseract.image_to_string(image)
-                text += f"Page {i+1}:\n{page_text}\n\n"
-            return text
-        except Exception as e:
-            logger.error(f"PDF OCR failed: {str(e)}")
-            return ""
+            window_size = max(1, settings.OCR_PAGE_WINDOW)
+            for window_start in range(0, doc.page_count, window_size):
+                window_end = min(window_start + window_size, doc.page_count)
+                page_texts = {}
+                ocr_pages = []
+
+                # Method 1: Direct text extraction using PyMuPDF
+                for page_index in range(window_start, window_end):
+                    page = doc[page_index]
+                    page_text = page.get_text()
+                    if self._page_needs_ocr(page, page_text):
+                        ocr_pages.append(page_index)
+                    else:
+                        page_texts[page_index] = page_text
+
+                # Method 2: OCR for scanned pages only
+                if ocr_pages:
+                    logger.info(f"OCR needed for {len(ocr_pages)} of pages {window_start + 1}-{window_end}")
+                    page_keys = self._pdf_page_keys(doc, ocr_pages)
+                    for page_index, page_text in self._ocr_pdf_pages(str(path), page_keys).items():
+                        page_texts[page_index] = page_text + "\n"
+
+                for page_index in range(window_start, window_end):
+                    if page_index in page_texts:
+                        yield page_texts[page_index]
+        finally:
+            doc.close()
+
+    def _page_needs_ocr(self, page, page_text: str) -> bool:
+        """A page is a scan when it has (almost) no text layer but is mostly covered by images"""
+        page_area = abs(page.rect)
+        if not page_area:
+            return False
+
+        # Characters per square inch (72 points per inch)
+        text_density = len(page_text.strip()) / (page_area / (72 * 72))
+        if text_density > settings.OCR_MAX_TEXT_DENSITY:
+            return False
+
+        image_area = sum(
+            abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info()
+        )
+        return min(image_area / page_area, 1.0) >= settings.OCR_MIN_IMAGE_COVERAGE
     
-    def _extract_from_docx(self, content: bytes) -> str:
-        """Extract text from Word document"""
+    def _iter_ocr_pdf(self, path: Path) -> Iterator[str]:
+        """OCR every page of a PDF that PyMuPDF cannot open"""
         try:
-            doc = Document(io.BytesIO(content))
-            text = ""
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            
-            # Also extract text from tables
-            for table in doc.tables:
-                for row in table.rows:
-                    for cell in row.cells:
-                        if cell.text.strip():
-                            text += cell.text + "\n"
-            
-            return text
+            page_count = pdf2image.pdfinfo_from_path(str(path))["Pages"]
+            # No per-page content to hash, so key pages by file content instead
+            file_hash = file_sha256(path)
+            window_size = max(1, settings.OCR_PAGE_WINDOW)
+            for window_start in range(0, page_count, window_size):
+                page_keys = {
+                    page_index: hashlib.sha256(
+                        f"{file_hash}:{page_index}:{settings.OCR_DPI}".encode()
+                    ).hexdigest()
+                    for page_index in range(window_start, min(window_start + window_size, page_count))
+                }
+                page_texts = self._ocr_pdf_pages(str(path), page_keys)
+                for page_index in sorted(page_keys):
+                    yield f"Page {page_index + 1}:\n{page_texts.get(page_index, '')}\n\n"
         except Exception as e:
-            logger.error(f"DOCX extraction failed: {str(e)}")
+            # Earlier pages may already be chunked: a truncated document must not pass as ingested
+            logger.error(f"PDF OCR failed: {str(e)}")
             raise
+
+    def _pdf_page_keys(self, doc, page_indexes) -> Dict[int, str]:
+        """Hash each page's content stream and embedded images (no rendering needed)"""
+        keys = {}
+        for page_index in page_indexes:
+            page = doc[page_index]
+            digest = hashlib.sha256()
+            # Render settings change the OCR output, so they are part of the key
+            digest.update(f"{settings.OCR_DPI}:{page.rotation}:{tuple(page.rect)}".encode())
+            digest.update(page.read_contents())
+            for image in page.get_images(full=True):
+                digest.update(doc.xref_stream_raw(image[0]) or b"")
+            keys[page_index] = digest.hexdigest()
+        return keys
+
+    def _ocr_pdf_pages(self, pdf_path: str, page_keys: Dict[int, str]) -> Dict[int, str]:
+        """OCR pages in bounded render windows across a pool of tesseract workers
+
+        Returns text by zero-based page index. Cached pages are never rendered.
+        If a page fails, the rest of its window is still OCRed and cached, then
+        an error is raised. The file is then reported as failed and kept out of
+        the manifest, so a re-run retries only the failed pages.
+        """
+        results = {}
+        todo = []
+        for page_index, page_key in sorted(page_keys.items()):
+            cached = self.ocr_cache.get(page_key)
+            if cached is not None:
+                results[page_index] = cached
+            else:
+                todo.append(page_index)
+
+        logger.info(f"OCR: {len(todo)} pages to process, {len(results)} cached")
+        if not todo:
+            return results
+
+        # Parallel tesseract processes would otherwise each spawn a thread per core
+        if settings.OCR_WORKERS > 1:
+            os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+        window_size = max(1, settings.OCR_PAGE_WINDOW)
+
+        with ThreadPoolExecutor(max_workers=max(1, settings.OCR_WORKERS)) as pool:
+            for start in range(0, len(todo), window_size):
+                window = todo[start:start + window_size]
+                futures = {
+                    pool.submit(pytesseract.image_to_string, image): page_index
+                    for page_index, image in self._render_pages(pdf_path, window)
+                }
+                failed_pages = []
+                for future in as_completed(futures):
+                    page_index = futures[future]
+                    try:
+                        page_text = future.result()
+                    except Exception as e:
+                        logger.error(f"OCR failed on page {page_index + 1}: {str(e)}")
+                        failed_pages.append(page_index + 1)
+                        continue
+                    results[page_index] = page_text
+                    self.ocr_cache.put(page_keys[page_index], page_text)
+
+                if failed_pages:
+                    raise RuntimeError(f"OCR failed on pages {sorted(failed_pages)} of {pdf_path}")
+
+                logger.info(f"OCR processed {min(start + window_size, len(todo))}/{len(todo)} pages")
+
+        return results
+
+    def _render_pages(self, pdf_path: str, page_indexes: List[int]):
+        """Render the given pages as PIL images, one contiguous page range at a time"""
+        rendered = []
+        run_start = prev = page_indexes[0]
+        for page_index in page_indexes[1:] + [None]:
+            if page_index is not None and page_index == prev + 1:
+                prev = page_index
+                continue
+            images = pdf2image.convert_from_path(
+                pdf_path,
+                dpi=settings.OCR_DPI,
+                first_page=run_start + 1,
+                last_page=prev + 1,
+            )
+            rendered.extend(zip(range(run_start, prev + 1), images))
+            if page_index is not None:
+                run_start = prev = page_index
+        return rendered
     
-    def _extract_from_pptx(self, content: bytes) -> str:
-        """Extract text from PowerPoint"""
-        try:
-            prs = Presentation(io.BytesIO(content))
-            text = ""
-            
-            for slide_num, slide in enumerate(prs.slides):
-                text += f"Slide {slide_num + 1}:\n"
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        text += shape.text + "\n"
-                text += "\n"
-            
-            return text
-        except Exception as e:
-            logger.error(f"PPTX extraction failed: {str(e)}")
-            raise
+    def _iter_docx(self, path: Path) -> Iterator[str]:
+        """Stream paragraphs (including table cells) from the document XML
+
+        Only word/document.xml is read, so embedded media never enters memory.
+        """
+        with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+            lines = []
+            size = 0
+            for _, element in ElementTree.iterparse(xml, events=("end",)):
+                if element.tag != f"{_W_NS}p":
+                    continue
+                text = "".join(
+                    (node.text or "") if node.tag == f"{_W_NS}t" else _W_BREAKS[node.tag]
+                    for node in element.iter()
+                    if node.tag == f"{_W_NS}t" or node.tag in _W_BREAKS
+                )
+                # Parsed paragraphs are dropped as soon as their text is taken
+                element.clear()
+                if text.strip():
+                    lines.append(text + "\n")
+                    size += len(text)
+                if size >= _SEGMENT_CHARS:
+                    yield "".join(lines)
+                    lines, size = [], 0
+            if lines:
+                yield "".join(lines)
     
-    def _extract_from_image(self, content: bytes) -> str:
+    def _iter_pptx(self, path: Path) -> Iterator[str]:
+        """Yield one segment per slide, reading only the slide XML parts"""
+        with zipfile.ZipFile(path) as archive:
+            for slide_num, slide_name in enumerate(self._pptx_slide_names(archive)):
+                slide = ElementTree.fromstring(archive.read(slide_name))
+                lines = [f"Slide {slide_num + 1}:\n"]
+                for paragraph in slide.iter(f"{_A_NS}p"):
+                    text = "".join(node.text or "" for node in paragraph.iter(f"{_A_NS}t"))
+                    if text.strip():
+                        lines.append(text + "\n")
+                lines.append("\n")
+                yield "".join(lines)
+
+    def _pptx_slide_names(self, archive: zipfile.ZipFile) -> List[str]:
+        """Slide part names in presentation order"""
+        presentation = ElementTree.fromstring(archive.read("ppt/presentation.xml"))
+        relationships = ElementTree.fromstring(archive.read("ppt/_rels/presentation.xml.rels"))
+        targets = {
+            rel.get("Id"): rel.get("Target")
+            for rel in relationships.iter(f"{_PKG_REL_NS}Relationship")
+        }
+
+        names = []
+        for slide_id in presentation.iter(f"{_P_NS}sldId"):
+            target = targets.get(slide_id.get(f"{_R_NS}id"))
+            if not target:
+                continue
+            if target.startswith("/"):
+                names.append(target.lstrip("/"))
+            else:
+                names.append(posixpath.normpath(posixpath.join("ppt", target)))
+        return names
+
+    def _iter_txt(self, path: Path) -> Iterator[str]:
+        """Read a text file in blocks, cutting on line boundaries"""
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            carry = ""
+            for block in iter(lambda: f.read(_SEGMENT_CHARS), ""):
+                block = carry + block
+                cut = block.rfind("\n") + 1
+                # A file without newlines still has to be flushed eventually
+                if cut == 0 and len(block) < _SEGMENT_CHARS * 4:
+                    carry = block
+                    continue
+                if cut == 0:
+                    cut = len(block)
+                yield block[:cut]
+                carry = block[cut:]
+            if carry:
+                yield carry
+    
+    def _iter_image(self, path: Path) -> Iterator[str]:
         """Extract text from image using OCR"""
         try:
-            image = Image.open(io.BytesIO(content))
-            text = pytesseract.image_to_string(image)
-            return text
+            with Image.open(path) as image:
+                yield pytesseract.image_to_string(image)
         except Exception as e:
             logger.error(f"Image OCR failed: {str(e)}")
             raise
     
-    def _chunk_text(self, text: str, chunk_size: int, chunk_overlap: int = 200) -> List[str]:
-        """Split text into chunks with sentence awareness"""
-        if not text.strip():
-            return []
-        
-        # First, split into paragraphs
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
-        
-        chunks = []
-        current_chunk = ""
-        
-        for paragraph in paragraphs:
-            # If paragraph is too long, split into sentences
-            if len(paragraph) > chunk_size:
-                sentences = sent_tokenize(paragraph)
-                for sentence in sentences:
-                    if len(current_chunk) + len(sentence) <= chunk_size:
-                        current_chunk += " " + sentence if current_chunk else sentence
-                    else:
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        current_chunk = sentence
-            else:
-                # Check if adding this paragraph would exceed chunk size
-                if len(current_chunk) + len(paragraph) <= chunk_size:
-                    current_chunk += " " + paragraph if current_chunk else paragraph
-                else:
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = paragraph
-        
+    def iter_chunks(self, segments: Iterable[str], chunk_size: int,
+                    chunk_overlap: int = settings.CHUNK_OVERLAP,
+                    token_counter: Optional["TokenCounter"] = None) -> Iterator[TextChunk]:
+        """Split a stream of text segments into sentence-aware, overlapping chunks
+
+        Single pass: every sentence enters and leaves the window once, so time
+        is linear in the text and memory is bounded by the chunk size. Sizes
+        are in characters, or in model tokens when a token_counter is given.
+        Offsets refer to the concatenation of all segments.
+        """
+        # Overlap must leave room for new text in every chunk
+        chunk_overlap = min(max(chunk_overlap, 0), chunk_size // 2)
+        # Joining sentences costs a space in characters but no word-piece
+        join_cost = 0 if token_counter else 1
+
+        window = deque()  # (unit, length) pairs of the chunk being built
+        window_size = 0  # their total length, without joining cost
+
+        def window_length(extra: int = 0) -> int:
+            units = len(window) + (1 if extra else 0)
+            return window_size + extra + max(units - 1, 0) * join_cost
+
+        for unit, unit_len in self._iter_units(segments, chunk_size, token_counter):
+            if window and window_length(unit_len) > chunk_size:
+                yield self._window_chunk(window)
+                # Keep the tail of the emitted chunk as overlap for the next one
+                window_size -= window.popleft()[1]
+                while window and (window_length() > chunk_overlap
+                                  or window_length(unit_len) > chunk_size):
+                    window_size -= window.popleft()[1]
+
+            window.append((unit, unit_len))
+            window_size += unit_len
+
         # Don't forget the last chunk
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        # Ensure no chunk is too large
-        final_chunks = []
-        for chunk in chunks:
-            if len(chunk) > chunk_size:
-                # Split large chunks by sentences
-                sentences = sent_tokenize(chunk)
-                temp_chunk = ""
-                for sentence in sentences:
-                    if len(temp_chunk) + len(sentence) <= chunk_size:
-                        temp_chunk += " " + sentence if temp_chunk else sentence
-                    else:
-                        if temp_chunk:
-                            final_chunks.append(temp_chunk.strip())
-                        temp_chunk = sentence
-                if temp_chunk:
-                    final_chunks.append(temp_chunk.strip())
+        if window:
+            yield self._window_chunk(window)
+
+    @staticmethod
+    def _window_chunk(window) -> TextChunk:
+        return TextChunk(
+            " ".join(unit.text for unit, _ in window),
+            window[0][0].char_start,
+            window[-1][0].char_end,
+        )
+
+    def _iter_units(self, segments: Iterable[str], chunk_size: int,
+                    token_counter: Optional["TokenCounter"]) -> Iterator[Tuple[TextChunk, int]]:
+        """Yield (sentence, length) for every paragraph, tracking offsets across segments"""
+        offset = 0
+        for segment in segments:
+            sentences = []
+            position = 0
+            for line in segment.splitlines(keepends=True):
+                paragraph = line.strip()
+                if paragraph:
+                    start = offset + position + (len(line) - len(line.lstrip()))
+                    sentences.extend(self._split_sentences(paragraph, start))
+                position += len(line)
+            offset += len(segment)
+
+            if not sentences:
+                continue
+
+            if token_counter:
+                # One batched tokenizer call per segment
+                lengths = token_counter.count([sentence.text for sentence in sentences])
             else:
-                final_chunks.append(chunk)
-        
-        return final_chunks
+                lengths = [len(sentence.text) for sentence in sentences]
+
+            for sentence, length in zip(sentences, lengths):
+                if length <= chunk_size:
+                    yield sentence, length
+                elif token_counter:
+                    yield from token_counter.wrap(sentence, chunk_size)
+                else:
+                    for piece in self._wrap_chars(sentence, chunk_size):
+                        yield piece, len(piece.text)
+
+    def _split_sentences(self, paragraph: str, start: int) -> List[TextChunk]:
+        """Split a paragraph into sentences with absolute offsets"""
+        sentences = []
+        cursor = 0
+        for sentence in sent_tokenize(paragraph):
+            found = paragraph.find(sentence, cursor)
+            sentence_start = found if found >= 0 else cursor
+            cursor = sentence_start + len(sentence)
+            sentences.append(TextChunk(sentence, start + sentence_start, start + cursor))
+        return sentences
+
+    def _wrap_chars(self, sentence: TextChunk, chunk_size: int) -> Iterator[TextChunk]:
+        """Hard-wrap a sentence longer than a chunk, preferring whitespace breaks"""
+        text, start = sentence.text, sentence.char_start
+        while len(text) > chunk_size:
+            cut = text.rfind(" ", 0, chunk_size + 1)
+            if cut <= 0:
+                cut = chunk_size
+            piece = text[:cut].rstrip()
+            yield TextChunk(piece, start, start + len(piece))
+            rest = text[cut:]
+            start += cut + len(rest) - len(rest.lstrip())
+            text = rest.lstrip()
+
+        if text:
+            yield TextChunk(text, start, start + len(text))
+
+    def _get_token_counter(self) -> "TokenCounter":
+        if self._token_counter is None:
+            self._token_counter = TokenCounter.from_pretrained(settings.SENTENCE_TRANSFORMER_MODEL)
+        return self._token_counter
 
     def get_supported_formats(self) -> List[str]:
         """Get list of supported file formats"""
-        return list(self.supported_extensions)
\ No newline at end of file
+        return list(self.supported_extensions)
+
+
+class TokenCounter:
+    """Measures text in word-pieces of the embedding model's own tokenizer"""
+
+    def __init__(self, tokenizer, max_seq_length: int):
+        self.tokenizer = tokenizer
+        # The model adds [CLS] and [SEP] around every input
+        self.max_tokens = max_seq_length - 2
+
+    @classmethod
+    def from_pretrained(cls, model_name: str) -> "TokenCounter":
+        """Load only the tokenizer and the input limit, never the model weights
+
+        Every extract worker builds one, so a full SentenceTransformer here
+        would put a copy of the weights in each process.
+        """
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        max_seq_length = cls._max_seq_length(model_name) or tokenizer.model_max_length
+        logger.info(f"Token-aware chunking with {model_name}, max {max_seq_length} tokens")
+        return cls(tokenizer, max_seq_length)
+
+    @staticmethod
+    def _max_seq_length(model_name: str) -> Optional[int]:
+        """max_seq_length from sentence_bert_config.json, as SentenceTransformer reads it"""
+        config_path = Path(model_name) / "sentence_bert_config.json"
+        if not config_path.is_file():
+            from huggingface_hub import hf_hub_download
+            try:
+                config_path = Path(hf_hub_download(model_name, "sentence_bert_config.json"))
+            except Exception as e:
+                logger.warning(f"No sentence_bert_config.json for {model_name}, using the tokenizer limit: {e}")
+                return None
+        return json.loads(config_path.read_text()).get("max_seq_length")
+
+    def count(self, texts: List[str]) -> List[int]:
+        """Token counts for a batch of texts (one fast-tokenizer call)"""
+        encoded = self.tokenizer(
+            texts,
+            add_special_tokens=False,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+        )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def wrap(self, sentence: TextChunk, max_tokens: int) -> Iterator[Tuple[TextChunk, int]]:
+        """Cut a sentence longer than max_tokens at token boundaries"""
+        offsets = self.tokenizer(
+            sentence.text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+        )["offset_mapping"]
+        for i in range(0, len(offsets), max_tokens):
+            window = offsets[i:i + max_tokens]
+            start, end = window[0][0], window[-1][1]
+            piece = TextChunk(
+                sentence.text[start:end],
+                sentence.char_start + start,
+                sentence.char_start + end,
+            )
+            yield piece, len(window)
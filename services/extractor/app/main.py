@@ -11,7 +11,9 @@ from datetime import datetime
 from pathlib import Path
 from app.config import settings
 from app.extract import DocumentProcessor
-from app.embed import EmbeddingGenerator
+from app.embed import EmbeddingGenerator, EMBEDDING_BACKENDS, check_backend_parity
+from app.pipeline import IngestPipeline
+from app.manifest import IngestManifest, file_sha256
 from app.utils.logging import setup_logging
 
 logger = setup_logging()
@@ -63,16 +65,42 @@ def cli():
 @click.option('--chunk-size', 
               default=settings.CHUNK_SIZE,
               help='Text chunk size in characters')
+@click.option('--chunk-overlap',
+              default=settings.CHUNK_OVERLAP,
+              help='Characters shared between consecutive chunks')
+@click.option('--chunking-mode',
+              type=click.Choice(['chars', 'tokens']),
+              default=settings.CHUNKING_MODE,
+              help='Size chunks in characters or in embedding-model tokens')
 @click.option('--batch-size', 
               default=settings.BATCH_SIZE,
               help='Batch size for embedding generation')
 @click.option('--error-dir',
               default=settings.ERROR_LOG_DIR,
               help='Directory to store error logs')
-def process(input_dir: str, collection: str, chunk_size: int, batch_size: int, error_dir: str):
+@click.option('--extract-workers',
+              default=settings.EXTRACT_WORKERS,
+              help='Number of processes extracting text and running OCR')
+@click.option('--embed-workers',
+              default=settings.EMBED_WORKERS,
+              help='Number of threads sharing the embedding model')
+@click.option('--move-processed/--keep-in-place',
+              default=settings.MOVE_PROCESSED,
+              help='Move ingested files to the processed directory')
+@click.option('--bulk',
+              is_flag=True,
+              help='Cold/full ingest: parallel gRPC uploads, HNSW indexing paused until the end')
+@click.option('--bulk-parallel',
+              default=settings.BULK_UPLOAD_PARALLEL,
+              help='Upload processes in bulk mode')
+def process(input_dir: str, collection: str, chunk_size: int, chunk_overlap: int, chunking_mode: str,
+            batch_size: int, error_dir: str, extract_workers: int, embed_workers: int,
+            move_processed: bool, bulk: bool, bulk_parallel: int):
     """Process all documents in directory and load into Qdrant"""
     # CHANGED: Direct function call instead of asyncio.run
-    process_documents(input_dir, collection, chunk_size, batch_size, error_dir)
+    process_documents(input_dir, collection, chunk_size, batch_size, error_dir,
+                      extract_workers, embed_workers, move_processed, chunk_overlap,
+                      chunking_mode, bulk, bulk_parallel)
 
 @cli.command()
 @click.argument('file_path')
@@ -97,14 +125,34 @@ def health():
     """Check service health and connections"""
     check_health()
 
+@cli.command()
+@click.option('--backend',
+              type=click.Choice(EMBEDDING_BACKENDS),
+              default=settings.EMBEDDING_BACKEND,
+              help='Embedding backend to compare against PyTorch')
+@click.option('--min-cosine',
+              default=settings.EMBEDDING_PARITY_MIN_COSINE,
+              help='Lowest acceptable cosine similarity to the PyTorch vectors')
+def check_backend(backend: str, min_cosine: float):
+    """Check that an embedding backend reproduces the PyTorch vectors"""
+    check_embedding_backend(backend, min_cosine)
+
 # CHANGED: Removed async
-def process_documents(input_dir: str, collection: str, chunk_size: int, batch_size: int, error_dir: str):
+def process_documents(input_dir: str, collection: str, chunk_size: int, batch_size: int, error_dir: str,
+                      extract_workers: int = settings.EXTRACT_WORKERS,
+                      embed_workers: int = settings.EMBED_WORKERS,
+                      move_processed: bool = settings.MOVE_PROCESSED,
+                      chunk_overlap: int = settings.CHUNK_OVERLAP,
+                      chunking_mode: str = settings.CHUNKING_MODE,
+                      bulk: bool = False,
+                      bulk_parallel: int = settings.BULK_UPLOAD_PARALLEL):
     """Process all documents in directory with error tracking"""
     logger.info(f"Starting document processing from: {input_dir}")
 
     processor = DocumentProcessor()
     embedder = EmbeddingGenerator()
     error_tracker = ErrorTracker(error_dir)
+    manifest = IngestManifest()
 
     # Health check first
     logger.info("Performing health checks...")
@@ -125,54 +173,49 @@ def process_documents(input_dir: str, collection: str, chunk_size: int, batch_si
 
     logger.info(f"Found {len(files)} files to process")
 
-    successful = 0
-    failed = 0
-
-    for file_path in files:
-        try:
-            logger.info(f"Processing: {file_path}")
-
-            # Extract and chunk text
-            # CHANGED: Direct call instead of await
-            chunks = processor.process_file(str(file_path), chunk_size)
-
-            if not chunks:
-                logger.warning(f"No content extracted from {file_path}")
-                error_tracker.log_error(str(file_path), "No content extracted", "extraction")
-                failed += 1
-                continue
-
-            # Generate embeddings and store in Qdrant
-            metadata = {
-                "collection": collection,
-                "file_path": str(file_path),
-                "batch_size": batch_size,
-            }
-            # CHANGED: Direct call instead of await
-            success = embedder.process_chunks(chunks, metadata)
-
-            if success:
-                successful += 1
-                logger.info(f"✅ Successfully processed {file_path} ({len(chunks)} chunks)")
-
-                # Move to processed directory (optional)
-                move_to_processed(file_path)
-            else:
-                failed += 1
-                error_tracker.log_error(str(file_path), "Embedding/Qdrant storage failed", "storage")
-                logger.error(f"❌ Failed to process {file_path}")
-
-        except Exception as e:
-            failed += 1
-            error_tracker.log_error(str(file_path), str(e), "exception")
-            logger.error(f"❌ Error processing {file_path}: {str(e)}")
+    def on_success(file_path: Path, chunk_count: int):
+        logger.info(f"✅ Successfully processed {file_path} ({chunk_count} chunks)")
+        # Move to processed directory (optional)
+        if move_processed:
+            move_to_processed(file_path)
+
+    def on_error(file_path: Path, error: str, error_type: str):
+        error_tracker.log_error(str(file_path), error, error_type)
+
+    pipeline = IngestPipeline(
+        embedder,
+        collection=collection,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        chunking_mode=chunking_mode,
+        batch_size=batch_size,
+        extract_workers=extract_workers,
+        embed_workers=embed_workers,
+        manifest=manifest,
+        input_dir=input_dir,
+        bulk=bulk,
+        bulk_parallel=bulk_parallel,
+        on_success=on_success,
+        on_error=on_error,
+    )
+    try:
+        stats = pipeline.run(files)
+    finally:
+        manifest.close()
+
+    successful = stats.successful
+    failed = stats.failed
 
     # Print summary
     logger.info("=" * 50)
     logger.info(f"PROCESSING SUMMARY:")
     logger.info(f"✅ Successful: {successful}")
     logger.info(f"❌ Failed: {failed}")
-    logger.info(f"📊 Success Rate: {(successful/len(files))*100:.1f}%")
+    logger.info(f"⏭️ Unchanged (skipped): {stats.skipped}")
+    # Unchanged files were not attempted, so they don't count against the rate
+    attempted = successful + failed
+    if attempted:
+        logger.info(f"📊 Success Rate: {(successful/attempted)*100:.1f}%")
 
     if failed > 0:
         error_summary = error_tracker.get_summary()
@@ -184,34 +227,49 @@ def process_single_file(file_path: str, collection: str):
     """Process a single file"""
     logger.info(f"Processing single file: {file_path}")
 
-    processor = DocumentProcessor()
+    processor = DocumentProcessor(settings.CHUNKING_MODE)
     embedder = EmbeddingGenerator()
+    manifest = IngestManifest()
 
     try:
-        # CHANGED: Direct call instead of await
-        chunks = processor.process_file(file_path, settings.CHUNK_SIZE)
+        file_hash = file_sha256(file_path)
+        previous = manifest.get(file_path, collection)
 
-        if not chunks:
-            logger.warning(f"No content extracted from {file_path}")
-            return
+        # Extraction, chunking and embedding run as one stream
+        # Same chunking settings as the process command, so both produce the same point IDs
+        chunks = processor.iter_file_chunks(file_path, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP,
+                                            base_dir=settings.INPUT_DIR)
 
         # Generate embeddings and store in Qdrant
         metadata = {
             "collection": collection,
             "file_path": file_path,
+            "file_hash": file_hash,
             "batch_size": settings.BATCH_SIZE,
         }
 
         # CHANGED: Direct call instead of await
-        success = embedder.process_chunks(chunks, metadata)
-
-        if success:
-            logger.info(f"✅ Successfully processed {file_path} ({len(chunks)} chunks)")
+        stored = embedder.process_chunks(chunks, metadata)
+
+        if stored:
+            embedder.delete_file_points(
+                collection,
+                file_path,
+                keep_hash=file_hash,
+                old_hash=previous.file_hash if previous else None,
+                old_chunk_count=previous.chunk_count if previous else 0,
+                old_hash_shared=bool(previous and manifest.hash_in_use(previous.file_hash, collection, file_path)),
+                new_chunk_count=stored,
+            )
+            manifest.record(Path(file_path), collection, file_hash, stored)
+            logger.info(f"✅ Successfully processed {file_path} ({stored} chunks)")
         else:
             logger.error(f"❌ Failed to process {file_path}")
 
     except Exception as e:
         logger.error(f"❌ Error processing {file_path}: {str(e)}")
+    finally:
+        manifest.close()
 
 # CHANGED: Removed async
 def display_recent_errors(error_dir: str):
@@ -261,6 +319,18 @@ def check_health():
         if not embedding_healthy:
             logger.error("  - Embedding service failed")
 
+def check_embedding_backend(backend: str, min_cosine: float):
+    """Compare a backend's embeddings with the PyTorch reference and exit non-zero on drift"""
+    logger.info(f"Comparing {backend} embeddings against torch for {settings.SENTENCE_TRANSFORMER_MODEL}...")
+
+    parity = check_backend_parity(settings.SENTENCE_TRANSFORMER_MODEL, backend)
+    logger.info(f"📊 Cosine to torch: min {parity['min_cosine']:.5f}, mean {parity['mean_cosine']:.5f}")
+
+    if parity["min_cosine"] < min_cosine:
+        logger.error(f"❌ {backend} drifts from torch (min cosine < {min_cosine})")
+        raise SystemExit(1)
+    logger.info(f"✅ {backend} matches torch")
+
 # CHANGED: Removed async
 def move_to_processed(file_path: Path):
     """Move processed file to processed directory"""
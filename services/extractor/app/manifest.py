@@ -0,0 +1,120 @@
+# services/extractor/app/manifest.py
+"""
+Persistent manifest of ingested files for incremental processing
+
+Each (source, collection) row remembers the file's size, mtime and content
+hash plus how many chunks were uploaded, so unchanged files can be skipped
+and changed files can have their old points replaced.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path) -> str:
+    """Hash a file's content without loading it into memory"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class ManifestEntry:
+    source: str
+    collection: str
+    file_hash: str
+    size: int
+    mtime_ns: int
+    chunk_count: int
+
+    def matches_stat(self, path: Path) -> bool:
+        """True when size and mtime are unchanged, i.e. the file needn't be opened"""
+        stat = path.stat()
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+
+class IngestManifest:
+    """SQLite-backed record of what has already been ingested"""
+
+    def __init__(self, manifest_path: str = settings.MANIFEST_PATH):
+        self.manifest_path = Path(manifest_path)
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared by the pipeline's main and upload threads
+        self._conn = sqlite3.connect(str(self.manifest_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    source TEXT NOT NULL,
+                    collection TEXT NOT NULL,
+                    file_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    chunk_count INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (source, collection)
+                )
+                """
+            )
+
+    def get(self, source: str, collection: str) -> Optional[ManifestEntry]:
+        """Look up the last ingested state of a file"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source, collection, file_hash, size, mtime_ns, chunk_count "
+                "FROM files WHERE source = ? AND collection = ?",
+                (source, collection),
+            ).fetchone()
+        return ManifestEntry(*row) if row else None
+
+    def record(self, path: Path, collection: str, file_hash: str, chunk_count: int):
+        """Store the state of a successfully ingested file"""
+        stat = path.stat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files "
+                "(source, collection, file_hash, size, mtime_ns, chunk_count, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(path), collection, file_hash, stat.st_size, stat.st_mtime_ns,
+                 chunk_count, datetime.now().isoformat()),
+            )
+
+    def hash_in_use(self, file_hash: str, collection: str, exclude_source: str) -> bool:
+        """True when another file in the collection was last ingested with this content hash
+
+        Point IDs come from (hash, chunk index), so identical files share points.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM files WHERE file_hash = ? AND collection = ? AND source != ? LIMIT 1",
+                (file_hash, collection, exclude_source),
+            ).fetchone()
+        return row is not None
+
+    def touch(self, path: Path, collection: str):
+        """Refresh size/mtime of a file whose content hash did not change"""
+        stat = path.stat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET size = ?, mtime_ns = ?, updated_at = ? "
+                "WHERE source = ? AND collection = ?",
+                (stat.st_size, stat.st_mtime_ns, datetime.now().isoformat(),
+                 str(path), collection),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,44 @@
+# services/extractor/app/ocr_cache.py
+"""
+On-disk cache of OCR results keyed by page hash
+"""
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OcrCache:
+    """Stores one text file per OCRed page under a two-level hash directory"""
+
+    def __init__(self, cache_dir: str = settings.OCR_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+
+    def _path_for(self, page_key: str) -> Path:
+        return self.cache_dir / page_key[:2] / f"{page_key}.txt"
+
+    def get(self, page_key: str) -> Optional[str]:
+        """Return cached text for a page, or None on a miss"""
+        try:
+            return self._path_for(page_key).read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Unreadable OCR cache entry {page_key}: {str(e)}")
+            return None
+
+    def put(self, page_key: str, text: str):
+        """Store text for a page; written atomically so concurrent workers never see partial files"""
+        path = self._path_for(page_key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write OCR cache entry {page_key}: {str(e)}")
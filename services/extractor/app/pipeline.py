@@ -0,0 +1,379 @@
+# services/extractor/app/pipeline.py
+"""
+Staged ingestion pipeline for the process command
+
+    extract (process pool) -> embed (model owner) -> upload (Qdrant)
+
+Stages are joined by bounded queues so a slow stage applies backpressure
+instead of buffering the whole corpus in memory.
+
+In bulk mode the upload stage gathers files into large parallel
+upload_collection calls and HNSW indexing is paused for the whole run.
+"""
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from app.config import settings
+from app.extract import DocumentProcessor
+from app.embed import EmbeddingGenerator
+from app.manifest import IngestManifest, ManifestEntry, file_sha256
+from app.utils.logging import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Queue sentinel telling a stage to shut down
+_STOP = object()
+
+# One DocumentProcessor per pool process, created by the pool initializer
+_worker_processor: Optional[DocumentProcessor] = None
+
+
+def _init_extract_worker(chunking_mode: str):
+    global _worker_processor
+    # Spawned workers start with a bare root logger
+    setup_logging()
+    _worker_processor = DocumentProcessor(chunking_mode)
+
+
+def _extract_worker(file_path: str, chunk_size: int, chunk_overlap: int,
+                    known_hash: Optional[str] = None,
+                    base_dir: Optional[str] = None) -> Tuple[str, Optional[List[Dict[str, Any]]]]:
+    """Hash, extract and chunk one file inside a pool process
+
+    Returns no chunks when the content hash equals ``known_hash``.
+    """
+    file_hash = file_sha256(file_path)
+    if file_hash == known_hash:
+        return file_hash, None
+    return file_hash, _worker_processor.process_file(file_path, chunk_size, chunk_overlap, base_dir)
+
+
+@dataclass
+class FileJob:
+    """One file travelling through the pipeline stages"""
+    path: Path
+    file_hash: str
+    previous: Optional[ManifestEntry]
+    chunks: List[Dict[str, Any]]
+    points: Optional[list] = None
+    # Bulk mode keeps the raw vectors instead of PointStructs
+    embeddings: Optional[Any] = None
+
+
+@dataclass
+class PipelineStats:
+    successful: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+class IngestPipeline:
+    """Run extraction, embedding and upload concurrently over many files"""
+
+    def __init__(self,
+                 embedder: EmbeddingGenerator,
+                 collection: str,
+                 chunk_size: int,
+                 batch_size: int,
+                 chunk_overlap: int = settings.CHUNK_OVERLAP,
+                 chunking_mode: str = settings.CHUNKING_MODE,
+                 extract_workers: int = settings.EXTRACT_WORKERS,
+                 embed_workers: int = settings.EMBED_WORKERS,
+                 queue_size: int = settings.PIPELINE_QUEUE_SIZE,
+                 manifest: Optional[IngestManifest] = None,
+                 input_dir: Optional[str] = None,
+                 bulk: bool = False,
+                 bulk_parallel: int = settings.BULK_UPLOAD_PARALLEL,
+                 on_success: Optional[Callable[[Path, int], None]] = None,
+                 on_error: Optional[Callable[[Path, str, str], None]] = None):
+        self.embedder = embedder
+        self.collection = collection
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunking_mode = chunking_mode
+        self.batch_size = batch_size
+        self.extract_workers = max(1, extract_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.queue_size = max(1, queue_size)
+        self.manifest = manifest
+        # Root the faculty tag of each file is taken from
+        self.input_dir = input_dir
+        self.bulk = bulk
+        self.bulk_parallel = max(1, bulk_parallel)
+        self.on_success = on_success
+        self.on_error = on_error
+        self.stats = PipelineStats()
+        # Callbacks and stats are touched from every stage
+        self._lock = threading.Lock()
+
+    def run(self, files: List[Path]) -> PipelineStats:
+        """Process all files and block until every stage has drained"""
+        # Shared setup happens once here rather than once per file
+        self.embedder._ensure_collection(self.collection)
+        if self.embedder.model is None:
+            self.embedder.load_model()
+
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        upload_queue = queue.Queue(maxsize=self.queue_size)
+
+        upload_thread: Optional[threading.Thread] = None
+        embed_threads: List[threading.Thread] = []
+        indexing_threshold = None
+        indexing_paused = False
+        try:
+            if self.bulk:
+                indexing_threshold = self.embedder.suspend_indexing(self.collection)
+                indexing_paused = True
+
+            # Consumer first, so started embed threads always have someone draining their queue
+            upload_thread = threading.Thread(target=self._upload_stage, args=(upload_queue,),
+                                             name="upload", daemon=True)
+            upload_thread.start()
+            for i in range(self.embed_workers):
+                thread = threading.Thread(target=self._embed_stage, args=(embed_queue, upload_queue),
+                                          name=f"embed-{i}", daemon=True)
+                thread.start()
+                embed_threads.append(thread)
+
+            logger.info(f"Pipeline started: {self.extract_workers} extract workers, "
+                        f"{self.embed_workers} embed workers")
+
+            self._extract_stage(files, embed_queue)
+        finally:
+            # Only threads that actually started are stopped and joined
+            for _ in embed_threads:
+                embed_queue.put(_STOP)
+            for thread in embed_threads:
+                thread.join()
+            if upload_thread is not None:
+                upload_queue.put(_STOP)
+                upload_thread.join()
+            if indexing_paused:
+                self.embedder.resume_indexing(self.collection, indexing_threshold)
+
+        return self.stats
+
+    def _extract_stage(self, files: List[Path], embed_queue: queue.Queue):
+        """Fan files out to the process pool, feeding results downstream in completion order"""
+        pending = {}
+        file_iter = iter(files)
+        # Keep the pool busy without submitting the whole corpus up front
+        max_in_flight = self.extract_workers * 2
+
+        # Spawn rather than fork: the parent already holds the torch model and stage threads
+        with ProcessPoolExecutor(max_workers=self.extract_workers,
+                                 mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_extract_worker,
+                                 initargs=(self.chunking_mode,)) as pool:
+            while True:
+                while len(pending) < max_in_flight:
+                    file_path = next(file_iter, None)
+                    if file_path is None:
+                        break
+
+                    try:
+                        previous = self._previous_entry(file_path)
+                        unchanged = previous is not None and previous.matches_stat(file_path)
+                    except Exception as e:
+                        # Deleted, renamed or unreadable since the directory was listed
+                        logger.error(f"❌ Error processing {file_path}: {str(e)}")
+                        self._record_failure(file_path, str(e), "exception")
+                        continue
+                    if unchanged:
+                        logger.info(f"⏭️ Unchanged, skipping: {file_path}")
+                        self._record_skip()
+                        continue
+
+                    logger.info(f"Processing: {file_path}")
+                    known_hash = previous.file_hash if previous else None
+                    future = pool.submit(_extract_worker, str(file_path), self.chunk_size,
+                                         self.chunk_overlap, known_hash, self.input_dir)
+                    pending[future] = (file_path, previous)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, previous = pending.pop(future)
+                    try:
+                        file_hash, chunks = future.result()
+                    except Exception as e:
+                        logger.error(f"❌ Error processing {file_path}: {str(e)}")
+                        self._record_failure(file_path, str(e), "exception")
+                        continue
+
+                    if chunks is None:
+                        # Touched but identical content: only the stat info changed
+                        logger.info(f"⏭️ Content unchanged, skipping: {file_path}")
+                        try:
+                            self.manifest.touch(file_path, self.collection)
+                        except Exception as e:
+                            logger.error(f"❌ Error processing {file_path}: {str(e)}")
+                            self._record_failure(file_path, str(e), "exception")
+                            continue
+                        self._record_skip()
+                        continue
+
+                    if not chunks:
+                        logger.warning(f"No content extracted from {file_path}")
+                        self._record_failure(file_path, "No content extracted", "extraction")
+                        continue
+
+                    # Blocks when embedding falls behind
+                    embed_queue.put(FileJob(file_path, file_hash, previous, chunks))
+
+    def _embed_stage(self, embed_queue: queue.Queue, upload_queue: queue.Queue):
+        """Pool chunks across files, embed them in global batches and hand points to the uploader"""
+        stopping = False
+        while not stopping:
+            # Block for one file, then take whatever else is already waiting
+            jobs = []
+            pooled_chunks = 0
+            item = embed_queue.get()
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                jobs.append(item)
+                pooled_chunks += len(item.chunks)
+                if pooled_chunks >= settings.GLOBAL_BATCH_MAX_CHUNKS:
+                    break
+                try:
+                    item = embed_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if jobs:
+                self._embed_jobs(jobs, upload_queue)
+
+    def _embed_jobs(self, jobs: List[FileJob], upload_queue: queue.Queue):
+        """Embed several files in one global batch, falling back to per-file on failure"""
+        try:
+            grouped = self.embedder.generate_embeddings_grouped(
+                [[chunk["text"] for chunk in job.chunks] for job in jobs],
+                as_arrays=self.bulk
+            )
+        except Exception as e:
+            if len(jobs) == 1:
+                logger.error(f"❌ Embedding failed for {jobs[0].path}: {str(e)}")
+                self._record_failure(jobs[0].path, str(e), "embedding")
+                return
+            # Isolate the file that broke the batch
+            logger.warning(f"Global embedding batch failed, retrying per file: {str(e)}")
+            for job in jobs:
+                self._embed_jobs([job], upload_queue)
+            return
+
+        logger.info(f"Embedded {sum(len(job.chunks) for job in jobs)} chunks from {len(jobs)} files")
+
+        for job, embeddings in zip(jobs, grouped):
+            if self.bulk:
+                # Points are assembled by the uploader, several files at a time
+                job.embeddings = embeddings
+                upload_queue.put(job)
+                continue
+            try:
+                job.points = self.embedder.build_points(job.chunks, embeddings, str(job.path), job.file_hash)
+            except Exception as e:
+                logger.error(f"❌ Embedding failed for {job.path}: {str(e)}")
+                self._record_failure(job.path, str(e), "embedding")
+                continue
+
+            upload_queue.put(job)
+
+    def _upload_stage(self, upload_queue: queue.Queue):
+        """Upsert each file's points into Qdrant, then drop its stale points"""
+        pending: List[FileJob] = []
+        pending_points = 0
+        while True:
+            item = upload_queue.get()
+            if item is _STOP:
+                break
+
+            job = item
+            if self.bulk:
+                pending.append(job)
+                pending_points += len(job.chunks)
+                if pending_points >= settings.BULK_FLUSH_POINTS:
+                    self._upload_bulk(pending)
+                    pending, pending_points = [], 0
+                continue
+
+            try:
+                uploaded = self.embedder.upload_points(job.points, self.collection, self.batch_size)
+            except Exception as e:
+                logger.error(f"❌ Upload failed for {job.path}: {str(e)}")
+                uploaded = False
+            self._finish_upload(job, uploaded)
+
+        if pending:
+            self._upload_bulk(pending)
+
+    def _upload_bulk(self, jobs: List[FileJob]):
+        try:
+            uploaded = self.embedder.upload_bulk(
+                [(job.chunks, job.embeddings, str(job.path), job.file_hash) for job in jobs],
+                self.collection,
+                parallel=self.bulk_parallel
+            )
+        except Exception as e:
+            # The upload thread must survive, or the embed threads block on a full queue forever
+            logger.error(f"❌ Bulk upload of {len(jobs)} files failed: {str(e)}")
+            uploaded = False
+        for job in jobs:
+            self._finish_upload(job, uploaded)
+
+    def _finish_upload(self, job: FileJob, uploaded: bool):
+        """Drop the file's stale points and record the outcome"""
+        if uploaded:
+            try:
+                # Only after the new version is in place, so readers never see a gap
+                self.embedder.delete_file_points(
+                    self.collection,
+                    str(job.path),
+                    keep_hash=job.file_hash,
+                    old_hash=job.previous.file_hash if job.previous else None,
+                    old_chunk_count=job.previous.chunk_count if job.previous else 0,
+                    old_hash_shared=bool(job.previous and self.manifest and self.manifest.hash_in_use(
+                        job.previous.file_hash, self.collection, str(job.path)
+                    )),
+                    new_chunk_count=len(job.chunks),
+                )
+                if self.manifest:
+                    self.manifest.record(job.path, self.collection, job.file_hash, len(job.chunks))
+            except Exception as e:
+                logger.error(f"❌ Upload failed for {job.path}: {str(e)}")
+                uploaded = False
+
+        if uploaded:
+            self._record_success(job.path, len(job.chunks))
+        else:
+            logger.error(f"❌ Failed to process {job.path}")
+            self._record_failure(job.path, "Embedding/Qdrant storage failed", "storage")
+
+    def _previous_entry(self, file_path: Path) -> Optional[ManifestEntry]:
+        if self.manifest is None:
+            return None
+        return self.manifest.get(str(file_path), self.collection)
+
+    def _record_skip(self):
+        with self._lock:
+            self.stats.skipped += 1
+
+    def _record_success(self, file_path: Path, chunk_count: int):
+        with self._lock:
+            self.stats.successful += 1
+            if self.on_success:
+                self.on_success(file_path, chunk_count)
+
+    def _record_failure(self, file_path: Path, error: str, error_type: str):
+        with self._lock:
+            self.stats.failed += 1
+            if self.on_error:
+                self.on_error(file_path, error, error_type)
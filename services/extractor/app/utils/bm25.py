@@ -0,0 +1,88 @@
+# services/extractor/app/utils/bm25.py
+"""
+BM25-style sparse vectors for Qdrant hybrid search
+
+Keep in sync with services/server/app/utils/bm25.py: documents are encoded
+here at ingest time and queries there, so both must tokenize and hash alike.
+"""
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Tuple
+
+# Standard BM25 term-frequency saturation and length normalisation
+K1 = 1.2
+B = 0.75
+# Typical chunk length in tokens (500-character chunks)
+AVG_DOC_LEN = 80.0
+
+# Words plus codes joined by - . / such as "cs-214", "b3", "l-31"
+_TOKEN_RE = re.compile(r"[^\W_]+(?:[-./][^\W_]+)*")
+
+_STOPWORDS = frozenset("""
+a about an and are as at be by for from has have how i in is it of on or that the this to was what when
+where which who will with you your
+ad al alla alle allo agli ai anche che chi come con da dal dalla dei del della delle dello degli di e
+gli il in la le lo ma mi ne nei nel nella non o per più quale quali quando se si sono su sul sulla tra
+un una uno è
+""".split())
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased terms; codes are kept whole and also as their parts
+
+    "CS-214" yields "cs-214", "cs214", "cs" and "214", so a query matches
+    however the code was written.
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(_strip_accents(text.casefold())):
+        token = match.group()
+        parts = re.split(r"[-./]", token)
+        if len(parts) > 1:
+            tokens.append(token)
+            tokens.append("".join(parts))
+            tokens.extend(part for part in parts if part not in _STOPWORDS)
+        elif token not in _STOPWORDS and (len(token) > 1 or token.isdigit()):
+            tokens.append(token)
+    return tokens
+
+
+def token_index(token: str) -> int:
+    """Stable 32-bit sparse dimension for a term (no shared vocabulary needed)"""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def _to_sparse(weights: Counter) -> Tuple[List[int], List[float]]:
+    merged = Counter()
+    for token, weight in weights.items():
+        # Hash collisions are rare; merge rather than emit duplicate indices
+        merged[token_index(token)] += weight
+    indices = sorted(merged)
+    return indices, [float(merged[index]) for index in indices]
+
+
+def document_vector(text: str) -> Tuple[List[int], List[float]]:
+    """Sparse BM25 term weights of a chunk (indices, values)
+
+    Inverse document frequency is not included: it would need corpus-wide
+    statistics, and stopword removal already drops the commonest terms.
+    """
+    tokens = tokenize(text)
+    if not tokens:
+        return [], []
+    length_norm = K1 * (1 - B + B * len(tokens) / AVG_DOC_LEN)
+    weights = Counter()
+    for token, tf in Counter(tokens).items():
+        weights[token] = tf * (K1 + 1) / (tf + length_norm)
+    return _to_sparse(weights)
+
+
+def query_vector(text: str) -> Tuple[List[int], List[float]]:
+    """Sparse query vector: each distinct term once, so the dot product sums document weights"""
+    return _to_sparse(Counter(dict.fromkeys(tokenize(text), 1.0)))
@@ -24,3 +24,12 @@ def parse_id(id_str: str) -> Optional[uuid.UUID]:
     except ValueError:
         return None
 
+
+
+# Fixed namespace so chunk IDs are stable across runs and machines
+_CHUNK_NAMESPACE = uuid.UUID("6f1c2a4e-8d3b-5e7f-9a10-3c5d7e9f1b2a")
+
+
+def generate_chunk_id(file_hash: str, chunk_index: int) -> str:
+    """Deterministic Qdrant point ID for a chunk, so re-upserts overwrite instead of duplicating"""
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f"{file_hash}:{chunk_index}"))
@@ -0,0 +1,72 @@
+# services/extractor/app/utils/qdrant_profiles.py
+"""
+HNSW and quantization profiles for the document collection
+
+Keep in sync with services/server/app/utils/qdrant_profiles.py: the extractor
+or the server may be the one to create the collection, and the server picks
+its search parameters from the same profile.
+"""
+from typing import Any, Dict, NamedTuple, Optional
+from qdrant_client.http import models
+
+
+class CollectionProfile(NamedTuple):
+    """How the collection is indexed and stored, and how it is searched by default"""
+    m: int  # HNSW links per node: more means better recall, more RAM
+    ef_construct: int  # HNSW build-time candidate list
+    quantization: bool  # int8 scalar quantization, kept in RAM
+    on_disk: bool  # float32 originals on disk (read only for rescoring)
+    hnsw_ef: Optional[int]  # search-time candidate list; None uses Qdrant's default
+    oversampling: float  # quantized candidates fetched per result before rescoring
+
+
+PROFILES: Dict[str, CollectionProfile] = {
+    # Qdrant defaults: float32 vectors and graph all in RAM
+    "default": CollectionProfile(m=16, ef_construct=100, quantization=False, on_disk=False,
+                                 hnsw_ef=None, oversampling=1.0),
+    # ~4x less vector RAM; rescoring with the originals keeps recall near float32
+    "balanced": CollectionProfile(m=16, ef_construct=200, quantization=True, on_disk=True,
+                                  hnsw_ef=128, oversampling=2.0),
+    # Millions of chunks on a small node: sparser graph, wider search to make up for it
+    "compact": CollectionProfile(m=8, ef_construct=100, quantization=True, on_disk=True,
+                                 hnsw_ef=64, oversampling=3.0),
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile: {name} (expected one of {', '.join(PROFILES)})")
+    return PROFILES[name]
+
+
+def collection_config(profile: CollectionProfile, vector_size: int) -> Dict[str, Any]:
+    """create_collection keyword arguments for the dense vectors of a profile"""
+    return {
+        "vectors_config": models.VectorParams(
+            size=vector_size,
+            distance=models.Distance.COSINE,
+            on_disk=profile.on_disk
+        ),
+        "hnsw_config": models.HnswConfigDiff(m=profile.m, ef_construct=profile.ef_construct),
+        "quantization_config": models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                # Clip the 1% outliers so they don't stretch the int8 range
+                quantile=0.99,
+                always_ram=True
+            )
+        ) if profile.quantization else None,
+    }
+
+
+def search_params(profile: CollectionProfile, hnsw_ef: Optional[int] = None,
+                  exact: bool = False) -> models.SearchParams:
+    """Per-query search parameters; hnsw_ef and exact override the profile"""
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef or profile.hnsw_ef,
+        exact=exact,
+        quantization=models.QuantizationSearchParams(
+            rescore=True,
+            oversampling=profile.oversampling
+        ) if profile.quantization else None
+    )
@@ -1,20 +1,34 @@
+import asyncio
+import json
 import logging
-from fastapi                                  import APIRouter, Depends, HTTPException
+from fastapi                                  import APIRouter, Depends, HTTPException, Query
 from fastapi                                  import status, WebSocket, WebSocketDisconnect
-from app.schemas                              import ChatRequest, ChatResponse
-from app.services.qdrant_client               import search_similar
-from app.core.auth                            import get_current_active_user, require_user
+from fastapi.responses                        import StreamingResponse
+from pydantic                                 import ValidationError
+from typing                                   import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from app.schemas                              import ChatRequest, ChatResponse, SourceCitation, ChunkResponse
+from app.services.qdrant_client               import search_similar, get_chunk
+from app.core.auth                            import get_current_active_user, require_user, authenticate_token
 from app.utils.idgen                          import generate_ulid
 #from app.services.ollama_client               import generate_response, get_session, generate_embeddings
 from app.services.bedrock_client              import (generate_response,
-                                                      generate_embeddings)
-from app.repositories.conversation_repository import get_conversation, create_conversation, add_message
-from app.core.database                        import get_db
+                                                      generate_embeddings,
+                                                      clean_response)
+from app.services.ollama_client               import generate_response_stream
+from app.services.answer_cache                import answer_cache
+from app.services.reranker                    import rerank
+from app.services.context_builder             import build_context
+from app.core.config                          import settings
+from app.repositories.conversation_repository import get_conversation, create_conversation, add_message, add_messages
+from app.core.database                        import get_db, AsyncSessionLocal
 from sqlalchemy.ext.asyncio                   import AsyncSession
 
 router = APIRouter()  # This line is crucial
 logger = logging.getLogger(__name__)
 
+# Keeps fire-and-forget persistence tasks alive until they finish
+_background_tasks: Set[asyncio.Task] = set()
+
 @router.get("/messages")
 async def get_messages():
     return {"message": "Get messages endpoint"}
@@ -23,6 +37,55 @@ async def get_messages():
 async def send_message():
     return {"message": "Send message endpoint"}
 
+async def _retrieve_context (message: str,
+                             filters: Optional[Dict[str, Any]] = None) -> Tuple[List[float], List[Dict[str, Any]], str]:
+    """Embed the question, fetch relevant chunks (optionally filtered) and build the context-aware prompt"""
+    query_embedding  = await generate_embeddings (message)
+    relevant_context = []
+    try:
+        # Over-fetch when a reranker will pick the best few
+        relevant_context = await search_similar (
+            query_embedding,
+            limit     =settings.RERANK_CANDIDATES if settings.RERANK_ENABLED else settings.RETRIEVAL_TOP_K,
+            query_text=message,
+            filters   =filters
+        )
+    except Exception as e:
+        logger.warning (f"Qdrant unavailable: {e}")
+
+    if settings.RERANK_ENABLED:
+        relevant_context = await rerank (message, relevant_context, top_k=settings.RETRIEVAL_TOP_K)
+
+    # Build context-aware prompt: merged, deduplicated and within the token budget
+    context_text, relevant_context = build_context (relevant_context)
+    enhanced_prompt = f"""Context: {context_text}
+
+        User Question: {message}
+
+        Please answer based on the context provided."""
+
+    return query_embedding, relevant_context, enhanced_prompt
+
+def _filters (request: ChatRequest) -> Optional[Dict[str, Any]]:
+    return request.filters.model_dump (exclude_none=True) if request.filters else None
+
+def _citations (hits: List[Dict[str, Any]]) -> List[SourceCitation]:
+    """Compact references to the chunks behind an answer; full text via GET /chunks/{id}"""
+    citations = []
+    for hit in hits:
+        snippet = hit["content"]
+        if len (snippet) > settings.CITATION_SNIPPET_CHARS:
+            snippet = snippet[:settings.CITATION_SNIPPET_CHARS].rsplit (" ", 1)[0] + "…"
+        citations.append (SourceCitation (
+            id         =str (hit["id"]),
+            source     =hit.get ("source", ""),
+            filename   =hit.get ("filename"),
+            chunk_index=hit.get ("chunk_index"),
+            score      =hit.get ("rerank_score", hit["score"]),
+            snippet    =snippet,
+        ))
+    return citations
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     request: ChatRequest,
@@ -31,83 +94,217 @@ async def chat(
 ):
     """Send a message to the LLM and get response (Authenticated)"""
     try:
-        # Call Ollama (functional) directly
-        #response_text = await generate_response (
-        #    prompt=request.prompt,
-        #    context=request.context  # optional
-        #)
-
         user_id = current_user.get ("sub")  # From JWT token
         #logger.info (f"user_id= {type (user_id)} - {user_id}")
 
-        # Get relevant context from Qdrant
-        query_embedding  = await generate_embeddings (request.message)
-        try:
-            relevant_context = await search_similar (
-                query_embedding,
-                limit=3
-            )
-        except Exception as e:
-            logger.warning (f"Qdrant unavailable: {e}")
+        conversation_id = request.conversation_id or generate_ulid ()
+        message_id      = generate_ulid ()
 
-        # Build context-aware prompt
-        context_text = "\n".join([doc["content"] for doc in relevant_context])
-        enhanced_prompt = f"""Context: {context_text}
-
-        User Question: {request.message}
-
-        Please answer based on the context provided."""
-
-        # Get LLM response
-        response = await generate_response(enhanced_prompt)
-
-        # Create or update conversation with user_id
-        if not request.conversation_id:
-            conversation_id = generate_ulid ()
-            await create_conversation (
+        async def record_question ():
+            """Flush the conversation and the user's message while retrieval runs"""
+            # Create conversation with user_id when it is new
+            if not request.conversation_id:
+                await create_conversation (
+                    session        =session,
+                    conversation_id=conversation_id,
+                    title          =request.message[:100] + "...",
+                    user_id        =user_id,  # Associate with authenticated user
+                    commit         =False
+                )
+            await add_message(
                 session        =session,
                 conversation_id=conversation_id,
-                title          =request.message[:100] + "...",
-                user_id        =user_id,  # Associate with authenticated user
+                role           ="user",
+                content        =request.message,
+                commit         =False
             )
-        else:
-            conversation_id = request.conversation_id
 
-        # Save messages
-        message_id = generate_ulid ()
-        await add_message(
-            session        =session,
-            conversation_id=conversation_id,
-            role           ="user",
-            content        =request.message
+        # Database writes and embedding + Qdrant retrieval are independent,
+        # so this stage costs only as much as the slower of the two. Both are
+        # awaited even if one fails: get_db must not roll the session back
+        # while record_question is still flushing on it.
+        # Trade-off: the flush opens the transaction early, so this request
+        # holds a pooled connection through the whole LLM call (up to
+        # BEDROCK_READ_TIMEOUT); see DATABASE_POOL_SIZE.
+        results = await asyncio.gather (
+            record_question (),
+            _retrieve_context (request.message, _filters (request)),
+            return_exceptions=True,
         )
-        await add_message(
+        for result in results:
+            if isinstance (result, BaseException):
+                raise result
+        _, (query_embedding, relevant_context, enhanced_prompt) = results
+
+        # Get LLM response, unless a near-identical question was already
+        # answered against the same retrieved points
+        response = None
+        if settings.ANSWER_CACHE_ENABLED:
+            response = answer_cache.lookup (query_embedding, relevant_context)
+        if response is None:
+            response = await generate_response(enhanced_prompt)
+            if settings.ANSWER_CACHE_ENABLED:
+                answer_cache.store (query_embedding, relevant_context, response)
+
+        # Same transaction as the conversation and the question: one commit, no refreshes
+        await add_messages(
             session        =session,
             conversation_id=conversation_id,
-            role           ="assistant",
-            content        =response
+            messages       =[("assistant", response)]
         )
 
         return ChatResponse(
             conversation_id=conversation_id,
             message_id     =message_id,
             response       =response,
-            sources        =relevant_context
+            sources        =_citations (relevant_context)
         )
 
     except Exception as e:
         logger.error(f"Chat error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to process chat request")
 
+@router.get("/chunks/{point_id}", response_model=ChunkResponse)
+async def read_chunk(
+    point_id: str,
+    current_user: dict = Depends (require_user),  # Require user role
+):
+    """Full text of a cited chunk, fetched only when the user expands a citation (Authenticated)"""
+    # Extractor point IDs are UUIDs; older collections may use integers
+    chunk_id = int (point_id) if point_id.isdigit () else point_id
+    try:
+        chunk = await get_chunk (chunk_id)
+    except Exception as e:
+        logger.warning (f"Chunk lookup failed for {point_id}: {e}")
+        chunk = None
+
+    if chunk is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chunk not found")
+    return chunk
+
+async def _persist_exchange (conversation_id: str, is_new: bool, user_id: str, question: str, answer: str):
+    """Store a streamed exchange in its own session, after the answer has been sent"""
+    try:
+        async with AsyncSessionLocal () as session:
+            if is_new:
+                await create_conversation (
+                    session        =session,
+                    conversation_id=conversation_id,
+                    title          =question[:100] + "...",
+                    user_id        =user_id,
+                    commit         =False
+                )
+            # Both messages in one batched transaction
+            await add_messages (
+                session        =session,
+                conversation_id=conversation_id,
+                messages       =[("user", question), ("assistant", answer)]
+            )
+    except Exception as e:
+        logger.error (f"Failed to persist conversation {conversation_id}: {str(e)}", exc_info=True)
+
+def _run_in_background (coro):
+    task = asyncio.create_task (coro)
+    _background_tasks.add (task)
+    task.add_done_callback (_background_tasks.discard)
+
+async def _stream_chat (request: ChatRequest, user_id: str) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Answer a chat request as a sequence of (event, data) pairs:
+    one "meta", then "token"s as the LLM produces them, then "done" (or "error").
+    """
+    is_new          = not request.conversation_id
+    conversation_id = request.conversation_id or generate_ulid ()
+    message_id      = generate_ulid ()
+
+    try:
+        query_embedding, relevant_context, enhanced_prompt = await _retrieve_context (request.message, _filters (request))
+
+        yield "meta", {
+            "conversation_id": conversation_id,
+            "message_id":      message_id,
+            "sources":         [citation.model_dump () for citation in _citations (relevant_context)],
+        }
+
+        cached = None
+        if settings.ANSWER_CACHE_ENABLED:
+            cached = answer_cache.lookup (query_embedding, relevant_context)
+
+        if cached is not None:
+            parts = [cached]
+            yield "token", {"text": cached}
+        else:
+            parts = []
+            async for text in generate_response_stream (enhanced_prompt):
+                parts.append (text)
+                yield "token", {"text": text}
+
+        # Normalised like /chat's answers, so the cache serves one format to both endpoints
+        response = clean_response ("".join (parts))
+        if cached is None and settings.ANSWER_CACHE_ENABLED:
+            answer_cache.store (query_embedding, relevant_context, response)
+
+    except Exception as e:
+        logger.error (f"Chat stream error: {str(e)}", exc_info=True)
+        yield "error", {"detail": "Failed to process chat request"}
+        return
+
+    # The user already has the answer; writing it down must not delay "done"
+    _run_in_background (_persist_exchange (conversation_id, is_new, user_id, request.message, response))
+    yield "done", {"conversation_id": conversation_id, "message_id": message_id, "response": response}
+
+def _sse (event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps (data, default=str)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    current_user: dict = Depends (require_user),  # Require user role
+):
+    """Send a message to the LLM and stream the answer as Server-Sent Events (Authenticated)"""
+    user_id = current_user.get ("sub")
+
+    async def events ():
+        async for event, data in _stream_chat (request, user_id):
+            yield _sse (event, data)
+
+    return StreamingResponse (
+        events (),
+        media_type="text/event-stream",
+        # Stop reverse proxies from buffering the stream
+        headers   ={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.websocket("/ws/chat")
-async def websocket_chat(websocket: WebSocket):
-    """WebSocket endpoint for real-time chat"""
+async def websocket_chat(websocket: WebSocket, token: Optional[str] = Query (None)):
+    """WebSocket endpoint for real-time chat
+
+    Browsers cannot set headers on a WebSocket, so the access token comes as
+    ?token=... or as a first {"type": "auth", "token": ...} message.
+    """
     await websocket.accept()
     try:
+        if token is None:
+            auth_message = await websocket.receive_json()
+            token = auth_message.get("token") if auth_message.get("type") == "auth" else None
+
+        current_user = await authenticate_token (token)
+        if not current_user:
+            await websocket.send_json({"type": "error", "detail": "Could not validate credentials"})
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+        user_id = current_user.get ("sub")
         while True:
             data = await websocket.receive_json()
-            # Handle WebSocket chat messages
-            await websocket.send_json({"type": "message", "content": "Response"})
+            try:
+                request = ChatRequest (**data)
+            except ValidationError as e:
+                await websocket.send_text(json.dumps ({"type": "error", "detail": e.errors()}, default=str))
+                continue
+
+            async for event, payload in _stream_chat (request, user_id):
+                await websocket.send_text(json.dumps ({"type": event, **payload}, default=str))
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
     except Exception as e:
@@ -2,11 +2,15 @@
 Health check endpoints
 """
 from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
 from datetime import datetime
 from app.schemas import HealthResponse
 from app.services.auth_client import health_check as auth_health_check
 from app.services.ollama_client import health_check as ollama_health_check
 from app.services.bedrock_client import health_check as bedrock_health_check
+from app.services.embedding_cache import embedding_cache
+from app.services.answer_cache import answer_cache
+from app.core.readiness import readiness
 
 router = APIRouter()
 
@@ -19,6 +23,14 @@ async def health_check():
         version="1.0.0"
     )
 
+@router.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the worker has warmed up its models and clients"""
+    return JSONResponse(
+        status_code=200 if readiness.ready else 503,
+        content=readiness.snapshot()
+    )
+
 @router.get("/health/detailed")
 async def detailed_health_check():
     """Detailed health check with service dependencies"""
@@ -56,5 +68,7 @@ async def detailed_health_check():
     return {
         "status": overall_status,
         "services": services,
+        "embedding_cache": embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
         "timestamp": datetime.now()
     }
\ No newline at end of file
@@ -8,6 +8,14 @@ import logging
 logger   = logging.getLogger(__name__)
 security = HTTPBearer()
 
+# Define role hierarchy
+ROLE_HIERARCHY = {
+    "viewer": 1,
+    "user": 2,
+    "editor": 3,
+    "admin": 4
+}
+
 async def get_current_user (
     credentials: HTTPAuthorizationCredentials = Depends (security)
 )-> Dict[str, Any]:
@@ -54,16 +62,8 @@ def require_role(required_role: str):
     ) -> Dict[str, Any]:
         user_role = current_user.get("role", "user")
 
-        # Define role hierarchy
-        role_hierarchy = {
-            "viewer": 1,
-            "user": 2,
-            "editor": 3,
-            "admin": 4
-        }
-
-        user_level = role_hierarchy.get(user_role, 0)
-        required_level = role_hierarchy.get(required_role, 0)
+        user_level = ROLE_HIERARCHY.get(user_role, 0)
+        required_level = ROLE_HIERARCHY.get(required_role, 0)
 
         if user_level < required_level:
             raise HTTPException(
@@ -75,6 +75,20 @@ def require_role(required_role: str):
 
     return role_checker
 
+async def authenticate_token(token: Optional[str], required_role: str = "user") -> Optional[Dict[str, Any]]:
+    """Validate a raw token where HTTP dependencies don't apply (e.g. WebSocket handshakes)"""
+    if not token:
+        return None
+
+    user_data = await verify_token (token)
+    if not user_data:
+        return None
+
+    if ROLE_HIERARCHY.get(user_data.get("role", "user"), 0) < ROLE_HIERARCHY.get(required_role, 0):
+        return None
+
+    return user_data
+
 async def require_user(current_user: dict = Depends(get_current_active_user)):
     """Require user authentication"""
     return current_user
@@ -36,6 +36,10 @@ class Settings(BaseSettings):
 
     # Database
     DATABASE_URL: str
+    # Each in-flight /chat request holds one connection from its first flush
+    # until the answer is committed, i.e. through the LLM call. Keep
+    # POOL_SIZE + MAX_OVERFLOW at or above the concurrent /chat requests per
+    # worker (at least BEDROCK_MAX_CONCURRENCY); beyond it, requests wait for a connection.
     DATABASE_POOL_SIZE: int = 20
     DATABASE_MAX_OVERFLOW: int = 30
 
@@ -52,9 +56,63 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "all-minilm"
     EMBEDDING_DIM: int = 384  # all-minilm dimension
 
+    # Local query embeddings (must match the extractor's model)
+    SENTENCE_TRANSFORMER_MODEL: str = "all-MiniLM-L6-v2"
+    EMBEDDING_BACKEND: str = "torch"  # "torch", "onnx" or "onnx-int8" (ONNX Runtime, CPU)
+    EMBEDDING_ONNX_INT8_FILE: str = "onnx/model_qint8_avx2.onnx"  # quantized file in the model repo
+    EMBEDDING_MICRO_BATCHING: bool = True  # encode concurrent queries together
+    EMBEDDING_BATCH_MAX_SIZE: int = 32  # texts per encode call
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 2.0  # how long a lone query waits for others
+
+    # Query embedding cache
+    EMBEDDING_CACHE_SIZE: int = 4096  # vectors kept per worker
+    EMBEDDING_CACHE_TTL: int = 86400  # seconds
+    EMBEDDING_CACHE_REDIS_URL: Optional[str] = None  # e.g. redis://redis:6379/0 to share across workers
+
+    # Semantic answer cache (same retrieved points + near-identical question)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIZE: int = 1024  # answers kept per worker
+    ANSWER_CACHE_TTL: int = 3600  # seconds
+    ANSWER_CACHE_SIMILARITY: float = 0.95  # min cosine between questions
+
     # Qdrant
     QDRANT_URL: str
     QDRANT_COLLECTION: str = "university_documents"
+    QDRANT_PREFER_GRPC: bool = True  # gRPC on QDRANT_GRPC_PORT instead of REST
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_TIMEOUT: int = 5  # seconds per call, including the wait for a free slot
+    QDRANT_MAX_CONCURRENCY: int = 32  # in-flight Qdrant calls per worker
+    # HNSW/quantization profile: "default", "balanced" or "compact" (app/utils/qdrant_profiles.py);
+    # must match the one the collection was created with
+    COLLECTION_PROFILE: str = "default"  # opt in to "balanced"/"compact" for large corpora
+    QDRANT_HNSW_EF: Optional[int] = None  # overrides the profile's search-time ef
+    QDRANT_EXACT_SEARCH: bool = False  # brute force, e.g. to measure recall
+
+    # Retrieval
+    RETRIEVAL_MODE: str = "hybrid"  # "dense" or "hybrid" (dense + BM25 sparse, fused with RRF)
+    SPARSE_VECTOR_NAME: str = "bm25"  # must match the extractor
+    HYBRID_CANDIDATES: int = 20  # hits fetched per retriever before fusion
+    RRF_K: int = 60
+    RETRIEVAL_TOP_K: int = 3  # chunks put into the prompt
+    # Payload indexes behind filtered search; keep in sync with the extractor
+    PAYLOAD_KEYWORD_INDEXES: List[str] = ["source", "filename", "file_type", "faculty", "file_hash"]
+    PAYLOAD_INTEGER_INDEXES: List[str] = ["chunk_index"]
+
+    # Cross-encoder re-ranking of retrieved chunks
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 30  # hits fetched for re-ranking
+    RERANK_BATCH_SIZE: int = 32
+    RERANK_MAX_LENGTH: int = 256  # tokens per (question, chunk) pair
+    # Per request; retrieval order is kept when exceeded. Must cover scoring
+    # RERANK_CANDIDATES pairs on the target CPU, or every request falls back
+    RERANK_BUDGET_MS: int = 150
+
+    # Prompt context assembly
+    CONTEXT_TOKEN_BUDGET: int = 1500  # tokens of retrieved text per prompt
+    CONTEXT_TOKENIZER: str = "o200k_base"  # tiktoken encoding of the target model
+    CONTEXT_DUPLICATE_THRESHOLD: float = 0.8  # share of the smaller passage's shingles found in another
+    CITATION_SNIPPET_CHARS: int = 200  # text returned per source in chat responses
 
     # Logging
     LOG_LEVEL: str = "INFO"
@@ -63,6 +121,10 @@ class Settings(BaseSettings):
     BEDROCK_API_KEY: str
     BEDROCK_REGION: str = "us-east-1"  # Ohio region
     BEDROCK_MODEL_ID: str
+    BEDROCK_MAX_CONCURRENCY: int = 16  # worker threads and pooled connections
+    BEDROCK_MAX_ATTEMPTS: int = 4  # adaptive retry mode, includes the first try
+    BEDROCK_CONNECT_TIMEOUT: int = 5  # seconds
+    BEDROCK_READ_TIMEOUT: int = 60  # seconds
     #BEDROCK_EMBEDDING_MODEL_ID embeddings generator for future use
 
     # Alternative: If using IAM credentials instead of API key
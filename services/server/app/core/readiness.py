@@ -0,0 +1,92 @@
+"""
+Startup warm-up and readiness state
+"""
+import asyncio
+import logging
+import time
+from typing                      import Any, Dict
+
+from app.services.embed_local    import generate_embeddings as local_generate_embeddings
+from app.services.qdrant_client  import health_check as qdrant_health_check, check_sparse_support
+from app.services.bedrock_client import warm_up as bedrock_warm_up
+from app.services.reranker       import warm_up as reranker_warm_up
+from app.core.config             import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Whether this worker has finished warming up, and how each component did"""
+
+    def __init__(self):
+        self.ready = False
+        self.components: Dict[str, str] = {}
+        self.warm_up_seconds = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "warming_up",
+            "components": dict(self.components),
+            "warm_up_seconds": self.warm_up_seconds,
+        }
+
+
+readiness = Readiness()
+
+
+async def _warm_embedding_model():
+    # Loads the model and runs one forward pass (first-call allocations, ONNX session setup)
+    vectors = await local_generate_embeddings(["warm up"])
+    if not vectors or not vectors[0]:
+        raise RuntimeError("embedding model returned no vector")
+
+
+async def _warm_qdrant():
+    # Opens the channel/connection pool with a cheap call
+    if not await qdrant_health_check():
+        raise RuntimeError("Qdrant not reachable")
+    if settings.RETRIEVAL_MODE == "hybrid":
+        # Settles once whether the collection supports hybrid search
+        await check_sparse_support()
+
+
+async def _warm_component(name: str, warm) -> bool:
+    readiness.components[name] = "warming_up"
+    try:
+        await warm()
+        readiness.components[name] = "ready"
+        logger.info(f"✅ Warmed up {name}")
+        return True
+    except Exception as e:
+        readiness.components[name] = f"failed: {e}"
+        logger.error(f"❌ Warm-up of {name} failed: {e}")
+        return False
+
+
+async def warm_up():
+    """Warm every dependency of /chat concurrently, then mark the worker ready
+
+    Only the embedding model gates readiness: without Qdrant or Bedrock the
+    chat still degrades gracefully, and every worker would be pulled from the
+    load balancer at once if they did.
+    """
+    started = time.monotonic()
+    optional = [
+        _warm_component("qdrant", _warm_qdrant),
+        _warm_component("bedrock", bedrock_warm_up),
+    ]
+    if settings.RERANK_ENABLED:
+        # A cold reranker would only blow its budget and fall back, so it doesn't gate readiness
+        optional.append(_warm_component("reranker", reranker_warm_up))
+
+    embedding_ok, *_ = await asyncio.gather(
+        _warm_component("embedding_model", _warm_embedding_model),
+        *optional,
+    )
+    readiness.warm_up_seconds = round(time.monotonic() - started, 2)
+    readiness.ready = embedding_ok
+
+    if readiness.ready:
+        logger.info(f"✅ Worker ready after {readiness.warm_up_seconds}s warm-up")
+    else:
+        logger.error("❌ Worker not ready: embedding model failed to load")
@@ -11,9 +11,15 @@ from fastapi.responses       import JSONResponse, FileResponse, HTMLResponse
 from app.core.config         import settings
 from app.utils.logging       import setup_logging
 from app.core.database       import init_db, close_db
+from app.core.readiness      import warm_up
 
 from app.controllers         import health, chat, conversations, auth
 from app.services.ollama_client import close_session as close_ollama_session
+from app.services.qdrant_client import close_qdrant_client
+from app.services.bedrock_client import close_bedrock_client
+from app.services.embedding_cache import embedding_cache
+from app.services.embed_local import embedding_batcher
+from app.services import reranker
 
 # Setup logging
 logger = setup_logging()
@@ -67,13 +73,23 @@ async def lifespan(app: FastAPI):
             else:
                 logger.error("All database connection attempts failed. Starting without database.")
 
+    # Load the embedding model and open Qdrant/Bedrock clients before the first
+    # user does; /api/v1/ready answers 503 until this finishes
+    warm_up_task = asyncio.create_task(warm_up())
+
     logger.info("API Server started successfully")
     yield
 
     # Shutdown
     logger.info("Shutting down API Server")
+    warm_up_task.cancel()
     await close_db()
     await close_ollama_session()
+    await close_qdrant_client()
+    await close_bedrock_client()
+    await embedding_cache.close()
+    await embedding_batcher.close()
+    reranker.close()
     logger.info("API Server stopped")
 
 # Create FastAPI app
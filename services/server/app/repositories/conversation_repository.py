@@ -1,7 +1,7 @@
 # services/server/app/repositories/conversation_repository.py
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy             import select, delete, update, or_, desc
-from typing                 import List, Optional, Dict, Any
+from typing                 import List, Optional, Dict, Any, Tuple
 from app.models             import Conversation, Message
 from app.schemas            import ConversationResponse, MessageResponse
 import logging
@@ -9,14 +9,22 @@ from app.utils.idgen        import generate_ulid
 
 logger = logging.getLogger (__name__)
 
-async def create_conversation (session: AsyncSession, conversation_id: str, title: str, user_id: str) -> Conversation:
-    """Create a new conversation for a specific user"""
+async def create_conversation (session: AsyncSession, conversation_id: str, title: str, user_id: str,
+                               commit: bool = True) -> Conversation:
+    """Create a new conversation for a specific user
+
+    With commit=False the row is only flushed, so it can share a transaction
+    with the messages that follow.
+    """
     conversation = Conversation (
         id     =conversation_id,
         user_id=user_id,
         title  =title
     )
     session.add (conversation)
+    if not commit:
+        await session.flush ()
+        return conversation
     await session.commit ()
     await session.refresh (conversation)
     return conversation
@@ -85,8 +93,9 @@ async def get_all_conversations(session: AsyncSession, skip: int = 0, limit: int
         for conv in conversations
     ]
 
-async def add_message(session: AsyncSession, conversation_id: str, role: str, content: str) -> Message:
-    """Add message to conversation"""
+async def add_message(session: AsyncSession, conversation_id: str, role: str, content: str,
+                      commit: bool = True) -> Message:
+    """Add message to conversation (flushed only, without commit=True)"""
     message = Message(
         conversation_id=conversation_id,
         #role=role,
@@ -96,10 +105,31 @@ async def add_message(session: AsyncSession, conversation_id: str, role: str, co
         #message_metadata=metadata or {}    # Changed from 'metadata' to 'message_metadata'
     )
     session.add(message)
+    if not commit:
+        await session.flush()
+        return message
     await session.commit()
     await session.refresh(message)
     return message
 
+async def add_messages(session: AsyncSession, conversation_id: str, messages: List[Tuple[str, str]],
+                       commit: bool = True) -> List[Message]:
+    """Add several (role, content) messages in one batch, without refreshing them"""
+    rows = [
+        Message(
+            conversation_id=conversation_id,
+            is_user_message=(role == "user"),
+            content=content,
+        )
+        for role, content in messages
+    ]
+    session.add_all(rows)
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
+    return rows
+
 async def get_messages(session: AsyncSession, conversation_id: str, user_id: Optional[str] = None) -> List[MessageResponse]:
     """Get all messages for a conversation, with optional user ownership check"""
     # First verify the conversation exists and belongs to user if user_id provided
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List, Dict, Any
+from typing import Optional, List
 from datetime import datetime
 
 # Health schemas
@@ -27,16 +27,43 @@ class ChatMessage(BaseModel):
     role: str
     content: str
 
+class SearchFilters(BaseModel):
+    """Restrict retrieval to chunks matching any of the listed values per field"""
+    source: Optional[List[str]] = None
+    filename: Optional[List[str]] = None
+    file_type: Optional[List[str]] = None  # e.g. ".pdf"
+    faculty: Optional[List[str]] = None  # top-level folder of the ingested file
+
 class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None
     message: str
     history: Optional[List[ChatMessage]] = None
+    filters: Optional[SearchFilters] = None
+
+class SourceCitation(BaseModel):
+    id: str  # Qdrant point ID, for GET /chunks/{id}
+    source: str
+    filename: Optional[str] = None
+    chunk_index: Optional[int] = None
+    score: float
+    snippet: str
 
 class ChatResponse(BaseModel):
     conversation_id: str
     message_id: str
     response: str
-    sources: Optional[List[Dict[str, Any]]] = None
+    sources: Optional[List[SourceCitation]] = None
+
+class ChunkResponse(BaseModel):
+    id: str
+    text: str
+    source: str
+    filename: Optional[str] = None
+    file_type: Optional[str] = None
+    chunk_index: Optional[int] = None
+    total_chunks: Optional[int] = None
+    char_start: Optional[int] = None
+    char_end: Optional[int] = None
 
 # Conversation schemas
 class ConversationCreate(BaseModel):
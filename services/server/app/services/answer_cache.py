@@ -0,0 +1,151 @@
+# services/server/app/services/answer_cache.py
+import hashlib
+import logging
+import time
+import numpy as np
+from collections     import OrderedDict
+from dataclasses     import dataclass, field
+from typing          import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (point id, point version) pairs; a re-upserted point gets a new version
+ContextKey = FrozenSet[Tuple[str, int]]
+
+
+@dataclass
+class _Bucket:
+    """Answers given for one exact retrieved context"""
+    vectors:   List[np.ndarray] = field (default_factory=list)
+    answers:   List[str]        = field (default_factory=list)
+    expires:   List[float]      = field (default_factory=list)
+
+
+def _context_key (sources: Iterable[Dict[str, Any]]) -> ContextKey:
+    return frozenset ((str (doc["id"]), doc.get ("version") or 0) for doc in sources)
+
+
+def _signature (key: ContextKey) -> str:
+    return hashlib.sha256 (repr (sorted (key)).encode ("utf-8")).hexdigest ()
+
+
+class AnswerCache:
+    """
+    Semantic cache of LLM answers.
+    An answer is reused when the new question retrieved exactly the same
+    points (at the same versions) and its embedding is within the similarity
+    threshold of a question already answered against them.
+
+    No explicit invalidation is needed: re-ingesting a document rewrites its
+    points with new versions (or new IDs), so later questions retrieve a
+    different context key and miss. Stale entries age out by LRU and TTL.
+    """
+
+    def __init__ (self,
+                  max_entries: int  = settings.ANSWER_CACHE_SIZE,
+                  ttl_seconds: int  = settings.ANSWER_CACHE_TTL,
+                  threshold: float  = settings.ANSWER_CACHE_SIMILARITY,
+                  per_context: int  = 8):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold   = threshold
+        self.per_context = per_context
+        # Accessed only from the event loop and never across an await
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict ()
+        self._size       = 0
+        self.hits        = 0
+        self.misses      = 0
+
+    def lookup (self, query_vector: List[float], sources: List[Dict[str, Any]]) -> Optional[str]:
+        """
+        Return a cached answer for a near-identical question over the same context.
+        """
+        if not sources or not query_vector:
+            return None
+
+        signature = _signature (_context_key (sources))
+        bucket    = self._buckets.get (signature)
+        if bucket is not None:
+            self._expire (signature, bucket)
+            bucket = self._buckets.get (signature)
+        if bucket is None:
+            self.misses += 1
+            return None
+
+        query      = self._unit (query_vector)
+        similarity = np.stack (bucket.vectors) @ query
+        best       = int (np.argmax (similarity))
+        if similarity[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        self._buckets.move_to_end (signature)
+        self.hits += 1
+        logger.info (f"⚡ Answer cache hit (similarity {similarity[best]:.3f})")
+        return bucket.answers[best]
+
+    def store (self, query_vector: List[float], sources: List[Dict[str, Any]], answer: str):
+        """
+        Remember an answer. Answers generated without retrieved context are never cached.
+        """
+        if not sources or not query_vector or not answer:
+            return
+
+        signature = _signature (_context_key (sources))
+        bucket    = self._buckets.get (signature)
+        if bucket is None:
+            bucket = _Bucket ()
+            self._buckets[signature] = bucket
+        self._buckets.move_to_end (signature)
+
+        if len (bucket.answers) >= self.per_context:
+            self._pop_entry (bucket, 0)
+
+        bucket.vectors.append (self._unit (query_vector))
+        bucket.answers.append (answer)
+        bucket.expires.append (time.monotonic () + self.ttl_seconds)
+        self._size += 1
+
+        # Evict least recently used contexts
+        while self._size > self.max_entries and self._buckets:
+            _, oldest = self._buckets.popitem (last=False)
+            self._size -= len (oldest.answers)
+
+    def clear (self):
+        self._buckets.clear ()
+        self._size = 0
+
+    def stats (self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries":     self._size,
+            "contexts":    len (self._buckets),
+            "hits":        self.hits,
+            "misses":      self.misses,
+            "hit_rate":    round (self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _expire (self, signature: str, bucket: _Bucket):
+        now = time.monotonic ()
+        for index in reversed (range (len (bucket.expires))):
+            if bucket.expires[index] <= now:
+                self._pop_entry (bucket, index)
+        if not bucket.answers:
+            del self._buckets[signature]
+
+    def _pop_entry (self, bucket: _Bucket, index: int):
+        bucket.vectors.pop (index)
+        bucket.answers.pop (index)
+        bucket.expires.pop (index)
+        self._size -= 1
+
+    @staticmethod
+    def _unit (vector: List[float]) -> np.ndarray:
+        array = np.asarray (vector, dtype=np.float32)
+        norm  = np.linalg.norm (array)
+        return array / norm if norm else array
+
+
+# Module-level singleton shared by all requests on this worker
+answer_cache = AnswerCache ()
@@ -1,11 +1,21 @@
 # services/server/app/services/bedrock_client.py
 import json
+import logging
 import re
 import asyncio
+import threading
 import boto3
-from typing                   import List
-from app.core.config          import settings
-from app.services.embed_local import generate_embeddings as local_generate_embeddings
+from botocore.config              import Config
+from concurrent.futures           import ThreadPoolExecutor
+from typing                       import AsyncIterator, List, Optional
+from app.core.config              import settings
+from app.services.embed_local     import generate_embeddings as local_generate_embeddings
+from app.services.embedding_cache import embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Cache namespace: vectors differ between models and between backends
+_EMBEDDING_CACHE_MODEL = f"{settings.SENTENCE_TRANSFORMER_MODEL}:{settings.EMBEDDING_BACKEND}"
 
 # ---------- helpers ----------
 
@@ -23,16 +33,158 @@ def clean_response(text: str) -> str:
     return text
 
 
+# Long-lived client and the threads that drive it. boto3 clients are
+# thread-safe, so one client (and its connection pool) serves every request.
+_bedrock_client = None
+_bedrock_executor: Optional[ThreadPoolExecutor] = None
+_bedrock_lock = threading.Lock()
+
+
 def _get_bedrock_client():
-    return boto3.client(
-        service_name="bedrock-runtime",
-        region_name=settings.BEDROCK_REGION,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-    )
+    global _bedrock_client
+    if _bedrock_client is None:
+        with _bedrock_lock:
+            if _bedrock_client is None:
+                _bedrock_client = boto3.client(
+                    service_name="bedrock-runtime",
+                    region_name=settings.BEDROCK_REGION,
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    config=Config(
+                        # One pooled connection per worker thread
+                        max_pool_connections=settings.BEDROCK_MAX_CONCURRENCY,
+                        retries={"max_attempts": settings.BEDROCK_MAX_ATTEMPTS, "mode": "adaptive"},
+                        connect_timeout=settings.BEDROCK_CONNECT_TIMEOUT,
+                        read_timeout=settings.BEDROCK_READ_TIMEOUT,
+                    ),
+                )
+                logger.info(f"Bedrock client created for {settings.BEDROCK_REGION}")
+    return _bedrock_client
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _bedrock_executor
+    if _bedrock_executor is None:
+        with _bedrock_lock:
+            if _bedrock_executor is None:
+                _bedrock_executor = ThreadPoolExecutor(
+                    max_workers=settings.BEDROCK_MAX_CONCURRENCY,
+                    thread_name_prefix="bedrock",
+                )
+    return _bedrock_executor
+
+
+async def _run_blocking(fn):
+    """Run a blocking boto3 call on the dedicated Bedrock pool.
+
+    The pool size caps concurrent Bedrock calls (streams hold a thread for
+    their whole duration); extra requests queue here.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), fn)
+
+
+async def warm_up():
+    """Create the shared client (credentials, endpoint, pool thread) ahead of the first request"""
+    await _run_blocking(_get_bedrock_client)
+
+
+async def close_bedrock_client():
+    """Release the Bedrock connection pool and worker threads"""
+    global _bedrock_client, _bedrock_executor
+    with _bedrock_lock:
+        executor, _bedrock_executor = _bedrock_executor, None
+        client, _bedrock_client = _bedrock_client, None
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if client:
+        client.close()
 
 # ---------- LLM (chat) ----------
 
+_SYSTEM_PROMPT = (
+    "You are a helpful assistant. "
+    "Answer concisely and directly. "
+    "Do not include reasoning, thinking, or explanations."
+)
+
+# Marks the end of a token stream handed over from the boto3 thread
+_STREAM_END = object()
+
+
+def _chat_body(prompt: str) -> dict:
+    return {
+        "messages": [
+            {
+                "role": "system",
+                "content": _SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ],
+        "max_completion_tokens": 300,
+        "temperature": 0.4,
+        "top_p": 0.9,
+    }
+
+
+class ReasoningFilter:
+    """
+    Streaming counterpart of clean_response: drops <reasoning>/<thinking>
+    blocks from text that arrives split at arbitrary points.
+    """
+
+    _OPEN_TAGS = ("<reasoning>", "<thinking>")
+
+    def __init__(self):
+        self._buffer  = ""
+        self._closing = None  # closing tag of the block being skipped
+
+    def feed(self, text: str) -> str:
+        """Add streamed text, return the part that is safe to emit"""
+        self._buffer += text
+        out = []
+        while self._buffer:
+            if self._closing:
+                end = self._buffer.find(self._closing)
+                if end == -1:
+                    # Keep just enough to recognise a closing tag split across chunks
+                    self._buffer = self._buffer[-(len(self._closing) - 1):]
+                    break
+                self._buffer  = self._buffer[end + len(self._closing):]
+                self._closing = None
+                continue
+
+            start = self._buffer.find("<")
+            if start == -1:
+                out.append(self._buffer)
+                self._buffer = ""
+                break
+
+            out.append(self._buffer[:start])
+            rest = self._buffer[start:]
+            tag  = next((tag for tag in self._OPEN_TAGS if rest.startswith(tag)), None)
+            if tag:
+                self._closing = "</" + tag[1:]
+                self._buffer  = rest[len(tag):]
+            elif any(tag.startswith(rest) for tag in self._OPEN_TAGS):
+                # Could still become an opening tag: wait for more text
+                self._buffer = rest
+                break
+            else:
+                out.append("<")
+                self._buffer = rest[1:]
+        return "".join(out)
+
+    def flush(self) -> str:
+        """Return held-back text once the stream has ended"""
+        text = "" if self._closing else self._buffer
+        self._buffer = ""
+        return text
+
+
 async def generate_response(prompt: str) -> str:
     """
     Generate a direct answer from Bedrock.
@@ -42,29 +194,9 @@ async def generate_response(prompt: str) -> str:
     def _invoke():
         client = _get_bedrock_client()
 
-        body = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are a helpful assistant. "
-                        "Answer concisely and directly. "
-                        "Do not include reasoning, thinking, or explanations."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "max_completion_tokens": 300,
-            "temperature": 0.4,
-            "top_p": 0.9,
-        }
-
         response = client.invoke_model(
             modelId=settings.BEDROCK_MODEL_ID,
-            body=json.dumps(body),
+            body=json.dumps(_chat_body(prompt)),
         )
 
         payload = json.loads(response["body"].read().decode("utf-8"))
@@ -73,7 +205,72 @@ async def generate_response(prompt: str) -> str:
         return clean_response(text)
 
     # boto3 is blocking → run in thread
-    return await asyncio.to_thread(_invoke)
+    return await _run_blocking(_invoke)
+
+
+async def generate_response_stream(prompt: str) -> AsyncIterator[str]:
+    """
+    Stream an answer from Bedrock token by token.
+    boto3 reads the event stream in a worker thread and hands text deltas to
+    the event loop through a queue.
+    """
+    loop  = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop  = threading.Event()
+
+    def _emit(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def _produce():
+        try:
+            client = _get_bedrock_client()
+
+            response = client.invoke_model_with_response_stream(
+                modelId=settings.BEDROCK_MODEL_ID,
+                body=json.dumps(_chat_body(prompt)),
+            )
+
+            for event in response["body"]:
+                if stop.is_set():
+                    break
+                chunk = event.get("chunk")
+                if chunk is None:
+                    # Modelled stream errors arrive as e.g. {"throttlingException": {...}}
+                    error = next((value for key, value in event.items() if key.endswith("Exception")), None)
+                    if error:
+                        raise RuntimeError(error.get("message", "Bedrock stream error"))
+                    continue
+
+                payload = json.loads(chunk["bytes"])
+                for choice in payload.get("choices", []):
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        _emit(text)
+
+            _emit(_STREAM_END)
+        except Exception as e:
+            _emit(e)
+
+    loop.run_in_executor(_get_executor(), _produce)
+
+    reasoning = ReasoningFilter()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                break
+            if isinstance(item, Exception):
+                raise item
+            text = reasoning.feed(item)
+            if text:
+                yield text
+
+        tail = reasoning.flush()
+        if tail:
+            yield tail
+    finally:
+        # Client went away or the stream ended: let the reader thread finish early
+        stop.set()
 
 # ---------- Embeddings ----------
 
@@ -104,9 +301,14 @@ async def generate_embeddings (text: str) -> List[float]:
     if not text:
         return []
 
+    cached = await embedding_cache.get (text, _EMBEDDING_CACHE_MODEL)
+    if cached is not None:
+        return cached
+
     # Local generator expects a list of strings
     embeddings = await local_generate_embeddings ([text])
 
+    await embedding_cache.set (text, _EMBEDDING_CACHE_MODEL, embeddings[0])
     return embeddings[0]
 
 async def health_check() -> bool:
@@ -117,12 +319,7 @@ async def health_check() -> bool:
 
     def _check():
         try:
-            client = boto3.client(
-                service_name="bedrock-runtime",
-                region_name=settings.BEDROCK_REGION,
-                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            )
+            client = _get_bedrock_client()
 
             # Minimal, low-cost request
             body = {
@@ -144,4 +341,4 @@ async def health_check() -> bool:
             logger.error(f"❌ Bedrock health check failed: {e}")
             return False
 
-    return await asyncio.to_thread(_check)
+    return await _run_blocking(_check)
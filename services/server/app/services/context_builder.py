@@ -0,0 +1,157 @@
+# services/server/app/services/context_builder.py
+import logging
+import re
+from dataclasses     import dataclass, field
+from typing          import Any, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger (__name__)
+
+_WORD = re.compile (r"\w+")
+
+_encoding = None
+
+
+@dataclass
+class Passage:
+    """One or more adjacent chunks of a file, merged into a single span"""
+    source:      str
+    text:        str
+    rank:        int  # best retrieval rank among its chunks
+    first_index: Optional[int]
+    last_index:  Optional[int]
+    char_end:    Optional[int]
+    hit_ids:     List[Any] = field (default_factory=list)
+
+
+def count_tokens (text: str) -> int:
+    """Tokens as the target model counts them; ~4 characters per token without tiktoken"""
+    global _encoding
+    if TIKTOKEN_AVAILABLE and _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding (settings.CONTEXT_TOKENIZER)
+        except Exception as e:
+            logger.warning (f"tiktoken encoding {settings.CONTEXT_TOKENIZER} unavailable, estimating tokens: {e}")
+            _encoding = False
+    if _encoding:
+        return len (_encoding.encode (text, disallowed_special=()))
+    return (len (text) + 3) // 4
+
+
+def _join_overlapping (head: str, tail: str) -> str:
+    """Concatenate two chunks whose texts share a run of sentences at the seam"""
+    for size in range (min (len (head), len (tail)), 0, -1):
+        if head.endswith (tail[:size]):
+            return head + tail[size:]
+    return f"{head} {tail}"
+
+
+def _merge_adjacent (hits: List[Dict[str, Any]]) -> List[Passage]:
+    """Merge hits from the same file whose chunk_index values are consecutive"""
+    passages: List[Passage] = []
+    by_file: Dict[Tuple[str, Any], List[Tuple[int, Dict[str, Any]]]] = {}
+    for rank, hit in enumerate (hits):
+        if not hit.get ("content"):
+            continue
+        if hit.get ("chunk_index") is None:
+            # Older points without positions: nothing to merge with
+            passages.append (Passage (hit.get ("source", ""), hit["content"], rank, None, None, None, [hit["id"]]))
+            continue
+        by_file.setdefault ((hit.get ("source", ""), hit.get ("file_hash")), []).append ((rank, hit))
+
+    for (source, _), ranked_hits in by_file.items ():
+        ranked_hits.sort (key=lambda pair: pair[1]["chunk_index"])
+        current = None
+        for rank, hit in ranked_hits:
+            if current is not None and hit["chunk_index"] == current.last_index + 1:
+                overlaps     = (hit.get ("char_start") is not None and current.char_end is not None
+                                and hit["char_start"] < current.char_end)
+                current.text = (_join_overlapping (current.text, hit["content"]) if overlaps
+                                else f"{current.text} {hit['content']}")
+                current.rank       = min (current.rank, rank)
+                current.last_index = hit["chunk_index"]
+                current.char_end   = hit.get ("char_end")
+                current.hit_ids.append (hit["id"])
+                continue
+
+            current = Passage (source, hit["content"], rank, hit["chunk_index"], hit["chunk_index"],
+                               hit.get ("char_end"), [hit["id"]])
+            passages.append (current)
+
+    passages.sort (key=lambda passage: passage.rank)
+    return passages
+
+
+def _shingles (text: str, size: int = 5) -> Set[Tuple[str, ...]]:
+    words = _WORD.findall (text.casefold ())
+    if len (words) <= size:
+        return {tuple (words)}
+    return {tuple (words[i:i + size]) for i in range (len (words) - size + 1)}
+
+
+def _drop_near_duplicates (passages: List[Passage], threshold: float) -> List[Passage]:
+    """
+    Keep the better-ranked of any two passages when most of the smaller one's
+    word shingles also appear in the other (containment, so a chunk repeated
+    inside a larger merged passage counts as a duplicate).
+    """
+    kept: List[Tuple[Passage, Set[Tuple[str, ...]]]] = []
+    for passage in passages:
+        shingles = _shingles (passage.text)
+        duplicate = any (
+            len (shingles & other) / min (len (shingles), len (other)) >= threshold
+            for _, other in kept
+        )
+        if not duplicate:
+            kept.append ((passage, shingles))
+    return [passage for passage, _ in kept]
+
+
+def _truncate_to_tokens (text: str, budget: int) -> str:
+    """Cut text to about budget tokens, at a word boundary"""
+    if count_tokens (text) <= budget:
+        return text
+    # Shrink proportionally, then settle with a couple of re-counts
+    cut = int (len (text) * budget / count_tokens (text))
+    while cut > 0 and count_tokens (text[:cut]) > budget:
+        cut = int (cut * 0.9)
+    return text[:cut].rsplit (" ", 1)[0]
+
+
+def build_context (hits: List[Dict[str, Any]],
+                   budget_tokens: int = settings.CONTEXT_TOKEN_BUDGET,
+                   duplicate_threshold: float = settings.CONTEXT_DUPLICATE_THRESHOLD) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Assemble prompt context from retrieved hits: merge adjacent chunks, drop
+    near-duplicates and pack passages in rank order into the token budget.
+    Returns the context text and the hits that made it in.
+    """
+    passages = _drop_near_duplicates (_merge_adjacent (hits), duplicate_threshold)
+
+    blocks: List[str] = []
+    used_ids: Set[Any] = set ()
+    remaining = budget_tokens
+    for passage in passages:
+        label  = f"[{passage.source.rsplit ('/', 1)[-1]}]\n" if passage.source else ""
+        block  = label + passage.text
+        tokens = count_tokens (block) + 1  # blank line between blocks
+        if tokens > remaining:
+            if blocks:
+                # A smaller, lower-ranked passage may still fit
+                continue
+            # Never send an empty context because the best passage is long
+            block  = _truncate_to_tokens (block, remaining)
+            tokens = remaining
+        blocks.append (block)
+        used_ids.update (passage.hit_ids)
+        remaining -= tokens
+        if remaining <= 0:
+            break
+
+    return "\n\n".join (blocks), [hit for hit in hits if hit["id"] in used_ids]
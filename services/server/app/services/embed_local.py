@@ -1,31 +1,153 @@
 # erutalia/services/server/app/services/embed_local.py
 import asyncio
 import logging
-from typing                import List
+import numpy as np
+from concurrent.futures    import ThreadPoolExecutor
+from typing                import Dict, List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
+from app.core.config       import settings
 
 logger = logging.getLogger (__name__)
 
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
 # Load model once (module-level singleton)
-_MODEL_NAME = "all-MiniLM-L6-v2"
+_MODEL_NAME = settings.SENTENCE_TRANSFORMER_MODEL
 _model      = None
 
 
+def load_sentence_transformer (model_name: str, backend: str) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer on CPU with the given inference backend.
+    "onnx-int8" runs the dynamically quantized graph from the model repo in ONNX Runtime.
+    """
+    if backend == "torch":
+        return SentenceTransformer (model_name, device="cpu")
+    if backend == "onnx":
+        return SentenceTransformer (model_name, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer (
+            model_name,
+            device       = "cpu",
+            backend      = "onnx",
+            model_kwargs = {"file_name": settings.EMBEDDING_ONNX_INT8_FILE},
+        )
+    raise ValueError (f"Unknown embedding backend: {backend} (expected one of {', '.join (EMBEDDING_BACKENDS)})")
+
+
 def _load_model():
     global _model
     if _model is None:
-        logger.info (f"🔹 Loading embedding model: {_MODEL_NAME}")
-        _model = SentenceTransformer (_MODEL_NAME)
-        return _model
+        logger.info (f"🔹 Loading embedding model: {_MODEL_NAME} ({settings.EMBEDDING_BACKEND})")
+        _model = load_sentence_transformer (_MODEL_NAME, settings.EMBEDDING_BACKEND)
+    return _model
+
+
+def check_backend_parity (backend: str, texts: List[str]) -> Dict[str, float]:
+    """
+    Cosine similarity between a backend's vectors and the PyTorch reference.
+    """
+    reference = load_sentence_transformer (_MODEL_NAME, "torch").encode (texts, normalize_embeddings=True)
+    candidate = load_sentence_transformer (_MODEL_NAME, backend).encode (texts, normalize_embeddings=True)
+    cosines   = np.sum (reference * candidate, axis=1)
+    return {"min_cosine": float (cosines.min ()), "mean_cosine": float (cosines.mean ())}
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched encode calls.
+    The first queued text waits at most max_wait_ms for company; texts that
+    arrive while a batch is encoding form the next batch.
+    """
+
+    def __init__ (self,
+                  max_batch_size: int = settings.EMBEDDING_BATCH_MAX_SIZE,
+                  max_wait_ms: float  = settings.EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.max_batch_size = max (1, max_batch_size)
+        self.max_wait       = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        # One forward pass at a time; torch already spreads it over the cores
+        self._executor = ThreadPoolExecutor (max_workers=1, thread_name_prefix="embed")
+
+    async def embed (self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop ()
+        if self._worker is None or self._worker.done ():
+            self._queue  = asyncio.Queue ()
+            self._worker = loop.create_task (self._run ())
+
+        futures = []
+        for text in texts:
+            future = loop.create_future ()
+            self._queue.put_nowait ((text, future))
+            futures.append (future)
+        return list (await asyncio.gather (*futures))
+
+    async def _collect (self) -> List[Tuple[str, asyncio.Future]]:
+        loop     = asyncio.get_running_loop ()
+        batch    = [await self._queue.get ()]
+        deadline = loop.time () + self.max_wait
+        while len (batch) < self.max_batch_size:
+            if not self._queue.empty ():
+                batch.append (self._queue.get_nowait ())
+                continue
+            remaining = deadline - loop.time ()
+            if remaining <= 0:
+                break
+            try:
+                batch.append (await asyncio.wait_for (self._queue.get (), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that gave up (e.g. client disconnected) need no vector
+        return [(text, future) for text, future in batch if not future.done ()]
+
+    async def _run (self):
+        loop = asyncio.get_running_loop ()
+        while True:
+            batch = await self._collect ()
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                # The first call also loads the model, off the event loop
+                embeddings = await loop.run_in_executor (
+                    self._executor,
+                    lambda: _load_model ().encode (texts, batch_size=len (texts)),
+                )
+            except Exception as e:
+                logger.error (f"Batched embedding of {len (texts)} texts failed: {e}")
+                for _, future in batch:
+                    if not future.done ():
+                        future.set_exception (e)
+                continue
+
+            for (_, future), embedding in zip (batch, embeddings):
+                if not future.done ():
+                    future.set_result (embedding.tolist ())
+
+    async def close (self):
+        if self._worker is not None:
+            self._worker.cancel ()
+            self._worker = None
+        self._executor.shutdown (wait=False)
+
+
+# Shared by all requests on this worker
+embedding_batcher = EmbeddingBatcher ()
 
 
 async def generate_embeddings (texts: List[str]) -> List[List[float]]:
     """
     Generate embeddings for a list of texts (async-friendly).
+    Concurrent callers are batched together unless EMBEDDING_MICRO_BATCHING is off.
     """
     if not texts:
         return []
 
+    if settings.EMBEDDING_MICRO_BATCHING:
+        return await embedding_batcher.embed (texts)
+
     model = _load_model ()
     loop  = asyncio.get_event_loop ()
 
@@ -36,4 +158,3 @@ async def generate_embeddings (texts: List[str]) -> List[List[float]]:
     )
 
     return embeddings.tolist ()
-
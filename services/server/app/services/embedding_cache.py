@@ -0,0 +1,144 @@
+# services/server/app/services/embedding_cache.py
+import asyncio
+import hashlib
+import logging
+import re
+import time
+import numpy as np
+from collections     import OrderedDict
+from typing          import Any, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+# Optional shared storage across workers/replicas
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text (text: str) -> str:
+    """
+    Normalise a query for cache lookup.
+    Only what all-MiniLM-L6-v2's tokenizer does itself: lower-casing and
+    splitting on whitespace. NFKC or casefold would merge inputs it keeps
+    apart (e.g. "ß" and "ss").
+    """
+    return _WHITESPACE.sub (" ", text).strip ().lower ()
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU of query vectors with a TTL, optionally backed by Redis.
+    """
+
+    def __init__ (self,
+                  max_entries: int         = settings.EMBEDDING_CACHE_SIZE,
+                  ttl_seconds: int         = settings.EMBEDDING_CACHE_TTL,
+                  redis_url: Optional[str] = settings.EMBEDDING_CACHE_REDIS_URL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict ()
+        # Only touched from the event loop; the lock keeps get/set atomic across awaits
+        self._lock      = asyncio.Lock ()
+        self.hits       = 0
+        self.misses     = 0
+        self.redis_hits = 0
+        self._redis     = None
+
+        if redis_url:
+            if REDIS_AVAILABLE:
+                self._redis = redis_asyncio.from_url (redis_url)
+                logger.info ("🔹 Embedding cache shared through Redis")
+            else:
+                logger.warning ("EMBEDDING_CACHE_REDIS_URL set but redis is not installed; using in-process cache only")
+
+    @staticmethod
+    def make_key (text: str, model: str) -> str:
+        digest = hashlib.sha256 (f"{model}\x00{normalize_text (text)}".encode ("utf-8")).hexdigest ()
+        return f"emb:{digest}"
+
+    async def get (self, text: str, model: str) -> Optional[List[float]]:
+        """
+        Return the cached vector, or None on a miss.
+        """
+        key = self.make_key (text, model)
+
+        async with self._lock:
+            entry = self._entries.get (key)
+            if entry is not None:
+                expires_at, vector = entry
+                if expires_at > time.monotonic ():
+                    self._entries.move_to_end (key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+
+        vector = await self._redis_get (key)
+        if vector is not None:
+            self.redis_hits += 1
+            self.hits       += 1
+            await self._put_local (key, vector)
+            return vector
+
+        self.misses += 1
+        return None
+
+    async def set (self, text: str, model: str, vector: List[float]):
+        key = self.make_key (text, model)
+        await self._put_local (key, vector)
+        await self._redis_set (key, vector)
+
+    async def _put_local (self, key: str, vector: List[float]):
+        async with self._lock:
+            self._entries[key] = (time.monotonic () + self.ttl_seconds, vector)
+            self._entries.move_to_end (key)
+            while len (self._entries) > self.max_entries:
+                self._entries.popitem (last=False)
+
+    async def _redis_get (self, key: str) -> Optional[List[float]]:
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get (key)
+        except Exception as e:
+            # A cache outage must never fail the request
+            logger.warning (f"Embedding cache Redis read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        return np.frombuffer (raw, dtype=np.float32).tolist ()
+
+    async def _redis_set (self, key: str, vector: List[float]):
+        if self._redis is None:
+            return
+        try:
+            # float32 is what the model produces, so the round trip is exact
+            await self._redis.set (key, np.asarray (vector, dtype=np.float32).tobytes (), ex=self.ttl_seconds)
+        except Exception as e:
+            logger.warning (f"Embedding cache Redis write failed: {e}")
+
+    def stats (self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries":     len (self._entries),
+            "max_entries": self.max_entries,
+            "hits":        self.hits,
+            "redis_hits":  self.redis_hits,
+            "misses":      self.misses,
+            "hit_rate":    round (self.hits / lookups, 4) if lookups else 0.0,
+            "shared":      self._redis is not None,
+        }
+
+    async def close (self):
+        if self._redis is not None:
+            await self._redis.close ()
+            self._redis = None
+
+
+# Module-level singleton shared by all requests on this worker
+embedding_cache = EmbeddingCache ()
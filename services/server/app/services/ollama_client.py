@@ -1,7 +1,8 @@
 # services/server/app/services/ollama_client.py
+import json
 import logging
 import aiohttp
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional
 from app.core.config import settings
 
 # Import the Bedrock client
@@ -12,6 +13,13 @@ except ImportError:
     BEDROCK_AVAILABLE = False
     logging.warning("Bedrock client not available")
 
+try:
+    from app.services.bedrock_client import generate_response_stream as generate_bedrock_stream
+    BEDROCK_STREAM_AVAILABLE = True
+except ImportError:
+    BEDROCK_STREAM_AVAILABLE = False
+    logging.warning("Bedrock streaming not available")
+
 logger = logging.getLogger(__name__)
 
 # Global session variable
@@ -43,19 +51,39 @@ async def generate_response(prompt: str, context: List[Dict[str, Any]] = None) -
     logger.info("Falling back to Ollama for response generation")
     return await generate_ollama_response(prompt, context)
 
-async def generate_ollama_response(prompt: str, context: List[Dict[str, Any]] = None) -> str:
-    """Generate response using Ollama"""
-    session = await get_session()
+async def generate_response_stream(prompt: str, context: List[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Stream a response from Bedrock, falling back to Ollama if Bedrock fails before the first token"""
+    if settings.USE_BEDROCK and BEDROCK_STREAM_AVAILABLE:
+        started = False
+        try:
+            logger.info("Using Bedrock for streamed response generation")
+            async for text in generate_bedrock_stream(_build_prompt(prompt, context)):
+                started = True
+                yield text
+            return
+        except Exception as e:
+            # Tokens already sent cannot be taken back
+            if started or not settings.FALLBACK_TO_OLLAMA:
+                raise
+            logger.warning(f"Bedrock stream failed: {e}")
+
+    logger.info("Falling back to Ollama for streamed response generation")
+    async for text in generate_ollama_response_stream(prompt, context):
+        yield text
 
+def _build_prompt(prompt: str, context: List[Dict[str, Any]] = None) -> str:
     if context:
         context_text = "\n".join([doc.get("text", doc.get("content", "")) for doc in context])
-        enhanced_prompt = f"Context: {context_text}\n\nUser Question: {prompt}"
-    else:
-        enhanced_prompt = prompt
+        return f"Context: {context_text}\n\nUser Question: {prompt}"
+    return prompt
+
+async def generate_ollama_response(prompt: str, context: List[Dict[str, Any]] = None) -> str:
+    """Generate response using Ollama"""
+    session = await get_session()
 
     payload = {
         "model": settings.OLLAMA_MODEL,
-        "prompt": enhanced_prompt,
+        "prompt": _build_prompt(prompt, context),
         "stream": False,
         "context": []
     }
@@ -72,6 +100,35 @@ async def generate_ollama_response(prompt: str, context: List[Dict[str, Any]] =
         logger.error(f"Ollama request failed: {str(e)}")
         raise
 
+async def generate_ollama_response_stream(prompt: str, context: List[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """Stream a response from Ollama (one JSON object per line)"""
+    session = await get_session()
+
+    payload = {
+        "model": settings.OLLAMA_MODEL,
+        "prompt": _build_prompt(prompt, context),
+        "stream": True,
+        "context": []
+    }
+
+    try:
+        async with session.post(f"{settings.OLLAMA_AWS_URL}/api/generate", json=payload) as response:
+            if response.status != 200:
+                logger.error(f"Ollama API error: {response.status}")
+                raise Exception(f"Ollama API returned {response.status}")
+
+            async for line in response.content:
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                if result.get("response"):
+                    yield result["response"]
+                if result.get("done"):
+                    break
+    except Exception as e:
+        logger.error(f"Ollama stream failed: {str(e)}")
+        raise
+
 async def generate_embeddings(text: str) -> List[float]:
     """Generate embeddings for text using Ollama"""
     session = await get_session()
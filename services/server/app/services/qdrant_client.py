@@ -1,63 +1,128 @@
 # services/server/app/services/qdrant_client.py
 import logging
-from qdrant_client        import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct, Filter, FieldCondition, MatchValue
-from typing               import List, Dict, Any, Optional
+import httpx
+from qdrant_client        import AsyncQdrantClient
+from qdrant_client.models import (PointStruct, Filter, FieldCondition, MatchAny,
+                                  SparseVectorParams, SparseVector, NamedSparseVector, SearchRequest,
+                                  ScoredPoint, PayloadSelectorInclude, PayloadSchemaType, SearchParams)
+from typing               import List, Dict, Any, Optional, Tuple
 import uuid
 import asyncio
-from functools            import partial
 
 from app.core.config      import settings
+from app.utils            import bm25
+from app.utils.qdrant_profiles import get_profile, collection_config, search_params
 
 logger = logging.getLogger(__name__)
 
-# Global client instance
-_qdrant_client = None
+# Global client instance, shared by every request on this worker
+_qdrant_client: Optional[AsyncQdrantClient] = None
+# Caps in-flight Qdrant calls so a slow search queues instead of piling up
+_qdrant_semaphore: Optional[asyncio.Semaphore] = None
+# Whether the collection has the BM25 sparse vector; None until its config has been read
+_sparse_available: Optional[bool] = None
 
-def get_qdrant_client () -> QdrantClient:
-    """Get or create Qdrant client"""
+# Payload fields retrieval actually uses; file_size, total_chunks etc. stay in Qdrant
+_SEARCH_PAYLOAD = PayloadSelectorInclude (
+    include=["text", "source", "filename", "file_hash", "chunk_index", "char_start", "char_end"]
+)
+# Fields served when a client expands a citation
+_CHUNK_PAYLOAD = PayloadSelectorInclude (
+    include=["text", "source", "filename", "file_type", "chunk_index", "total_chunks", "char_start", "char_end"]
+)
+
+def get_qdrant_client () -> AsyncQdrantClient:
+    """Get or create the async Qdrant client"""
     global _qdrant_client
-    for attempt in range (5):
-        try:
-            if _qdrant_client is None:
-                _qdrant_client = QdrantClient (url=settings.QDRANT_URL)
-                logger.info (f"Connected to Qdrant URL at {settings.QDRANT_URL}")
-                return _qdrant_client
-        except Exception as e:
-            logger.warning (f"Qdrant connection retry {attempt+1}/5: {e}")
-            #await asyncio.sleep (1) #sleep line
-    raise RuntimeError ("Qdrant not reachable after retries")
+    if _qdrant_client is None:
+        # Constructing the client does not connect; requests are made lazily
+        _qdrant_client = AsyncQdrantClient (
+            url         = settings.QDRANT_URL,
+            prefer_grpc = settings.QDRANT_PREFER_GRPC,
+            grpc_port   = settings.QDRANT_GRPC_PORT,
+            timeout     = settings.QDRANT_TIMEOUT,
+            # Passed to httpx when talking REST: keep-alive pool sized to the concurrency limit
+            limits      = httpx.Limits (
+                max_connections           = settings.QDRANT_MAX_CONCURRENCY,
+                max_keepalive_connections = settings.QDRANT_MAX_CONCURRENCY,
+            ),
+        )
+        transport = f"gRPC :{settings.QDRANT_GRPC_PORT}" if settings.QDRANT_PREFER_GRPC else "REST"
+        logger.info (f"Connected to Qdrant URL at {settings.QDRANT_URL} ({transport})")
+    return _qdrant_client
+
+def _get_semaphore () -> asyncio.Semaphore:
+    global _qdrant_semaphore
+    if _qdrant_semaphore is None:
+        _qdrant_semaphore = asyncio.Semaphore (settings.QDRANT_MAX_CONCURRENCY)
+    return _qdrant_semaphore
+
+async def _call (method, *args, timeout: Optional[float] = None, **kwargs):
+    """Run one client call under the concurrency limit, bounded by a timeout
+
+    The timeout covers waiting for a free slot too, so callers never wait
+    longer than it in total.
+    """
+    async def guarded ():
+        async with _get_semaphore ():
+            return await method (*args, **kwargs)
+
+    return await asyncio.wait_for (guarded (), timeout or settings.QDRANT_TIMEOUT)
 
 async def ensure_collection_exists(collection_name: str = "documents", vector_size: int = 384):
     """Create collection if it doesn't exist"""
     client = get_qdrant_client()
     try:
-        # Run synchronous Qdrant operations in thread pool
-        loop = asyncio.get_event_loop()
-        collections = await loop.run_in_executor(None, client.get_collections)
+        collections = await _call (client.get_collections)
         collection_names = [col.name for col in collections.collections]
 
         if collection_name not in collection_names:
-            await loop.run_in_executor(
-                None,
+            await _call (
                 client.create_collection,
-                collection_name,
-                VectorParams(size=vector_size, distance=Distance.COSINE)
+                collection_name = collection_name,
+                sparse_vectors_config = {settings.SPARSE_VECTOR_NAME: SparseVectorParams()},
+                **collection_config (get_profile (settings.COLLECTION_PROFILE), vector_size)
             )
-            logger.info(f"Created Qdrant collection: {collection_name}")
+            logger.info(f"Created Qdrant collection: {collection_name} ({settings.COLLECTION_PROFILE} profile)")
+            existing = set()
         else:
             logger.info(f"Qdrant collection already exists: {collection_name}")
+            existing = set((await _call (client.get_collection, collection_name)).payload_schema or {})
+
+        await _ensure_payload_indexes (client, collection_name, existing)
 
     except Exception as e:
         logger.error(f"Error ensuring collection exists: {e}")
         raise
 
+async def _ensure_payload_indexes (client: AsyncQdrantClient, collection_name: str, existing: set):
+    """Index the payload fields filtered search relies on; already indexed fields are skipped"""
+    wanted  = [(field, PayloadSchemaType.KEYWORD) for field in settings.PAYLOAD_KEYWORD_INDEXES]
+    wanted += [(field, PayloadSchemaType.INTEGER) for field in settings.PAYLOAD_INTEGER_INDEXES]
+    for field, schema in wanted:
+        if field in existing:
+            continue
+        await _call (
+            client.create_payload_index,
+            collection_name = collection_name,
+            field_name      = field,
+            field_schema    = schema,
+        )
+        logger.info(f"Created {schema.value} payload index: {collection_name}.{field}")
+
+def build_filter (filters: Optional[Dict[str, Optional[List[Any]]]]) -> Optional[Filter]:
+    """Qdrant filter from {field: [values]}: a chunk must match one value of every given field"""
+    conditions = [
+        FieldCondition (key=field, match=MatchAny (any=list (values)))
+        for field, values in (filters or {}).items ()
+        if values
+    ]
+    return Filter (must=conditions) if conditions else None
+
 async def store_embeddings(documents: List[Dict[str, Any]], collection_name: str = "documents") -> bool:
     """Store document embeddings in Qdrant"""
     client = get_qdrant_client()
     try:
-        loop = asyncio.get_event_loop()
-
         points = []
         for doc in documents:
             point = PointStruct(
@@ -75,13 +140,7 @@ async def store_embeddings(documents: List[Dict[str, Any]], collection_name: str
             )
             points.append(point)
 
-        # Run upsert in thread pool
-        await loop.run_in_executor(
-            None,
-            client.upsert,
-            collection_name,
-            points
-        )
+        await _call (client.upsert, collection_name=collection_name, points=points)
 
         logger.info(f"Stored {len(points)} documents in Qdrant collection: {collection_name}")
         return True
@@ -90,61 +149,154 @@ async def store_embeddings(documents: List[Dict[str, Any]], collection_name: str
         logger.error(f"Error storing embeddings in Qdrant: {e}")
         return False
 
-# async def search_similar(
-    # query_embedding: List[float], 
-    # limit: int = 5, 
-    # collection_name: str = "documents",
-    # score_threshold: float = 0.7
-# ) -> List[Dict[str, Any]]:
-async def search_similar(query_vector: List[float], limit: int = 5) -> List[Dict[str, Any]]:
-    """Search for similar documents in Qdrant"""
-    client = get_qdrant_client()
-    try:
-        # loop = asyncio.get_event_loop()
+def reciprocal_rank_fusion (result_lists: List[List[ScoredPoint]], k: int = 60) -> List[Tuple[ScoredPoint, float]]:
+    """Merge ranked hit lists: each list adds 1 / (k + rank) to a point's score"""
+    scores: Dict[Any, float]       = {}
+    hits:   Dict[Any, ScoredPoint] = {}
+    for result in result_lists:
+        for rank, hit in enumerate (result, start=1):
+            scores[hit.id] = scores.get (hit.id, 0.0) + 1.0 / (k + rank)
+            hits.setdefault (hit.id, hit)
+    return [(hits[point_id], scores[point_id]) for point_id in sorted (scores, key=scores.get, reverse=True)]
+
+async def check_sparse_support () -> Optional[bool]:
+    """Read once from the collection config whether hybrid search is possible
+
+    Stays unknown (None) while Qdrant is unreachable, so it is asked again on
+    the next search instead of turning hybrid search off for good.
+    """
+    global _sparse_available
+    if _sparse_available is None:
+        try:
+            info = await _call (get_qdrant_client ().get_collection, settings.QDRANT_COLLECTION)
+        except Exception as e:
+            logger.warning (f"Could not read the collection config to check for sparse vectors: {e}")
+            return None
+        sparse_config     = info.config.params.sparse_vectors or {}
+        _sparse_available = settings.SPARSE_VECTOR_NAME in sparse_config
+        if not _sparse_available:
+            logger.warning (f"Collection {settings.QDRANT_COLLECTION} has no '{settings.SPARSE_VECTOR_NAME}' "
+                            f"sparse vectors; using dense search only (re-ingest and restart to enable hybrid)")
+    return _sparse_available
 
-        # Run search in thread pool
-        # results = await loop.run_in_executor(
-            # None, client.search, collection_name, query_embedding, limit,score_threshold)
-        results = client.search(
+async def _hybrid_search (client: AsyncQdrantClient, query_vector: List[float], query_text: str,
+                          limit: int, query_filter: Optional[Filter] = None,
+                          params: Optional[SearchParams] = None) -> Optional[List[Tuple[ScoredPoint, float]]]:
+    """Dense and BM25 searches in one round trip, fused with RRF; None when sparse search is unavailable"""
+    if not await check_sparse_support ():
+        return None
+    indices, values = bm25.query_vector (query_text)
+    if not indices:
+        return None
+
+    candidates = max (limit, settings.HYBRID_CANDIDATES)
+    try:
+        dense_hits, sparse_hits = await _call (
+            client.search_batch,
             collection_name=settings.QDRANT_COLLECTION,
-            query_vector=query_vector,
-            limit=limit
+            requests=[
+                SearchRequest (vector=query_vector, filter=query_filter, params=params, limit=candidates,
+                               with_payload=_SEARCH_PAYLOAD),
+                SearchRequest (
+                    vector      =NamedSparseVector (
+                        name  =settings.SPARSE_VECTOR_NAME,
+                        vector=SparseVector (indices=indices, values=values)
+                    ),
+                    filter      =query_filter,
+                    limit       =candidates,
+                    with_payload=_SEARCH_PAYLOAD
+                ),
+            ]
         )
-        """ similar_docs = []
-        for result in results:
-            similar_docs.append({
-                "id": result.id,
-                "score": result.score,
-                "content": result.payload.get("text", ""),
-                "file_path": result.payload.get("file_path", ""),
-                "file_type": result.payload.get("file_type", ""),
-                "source": result.payload.get("source", ""),
-                "metadata": result.payload.get("metadata", {})
-            })
-
-        logger.info(f"Found {len(similar_docs)} similar documents with score >= {score_threshold}")
-        return similar_docs """
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        # E.g. Qdrant restarting: dense search for this request only
+        logger.warning (f"Hybrid search failed, using dense search for this request: {e}")
+        return None
+
+    return reciprocal_rank_fusion ([dense_hits, sparse_hits], settings.RRF_K)[:limit]
+
+async def search_similar(query_vector: List[float], limit: int = 5, query_text: Optional[str] = None,
+                         filters: Optional[Dict[str, Optional[List[Any]]]] = None,
+                         hnsw_ef: Optional[int] = None, exact: Optional[bool] = None) -> List[Dict[str, Any]]:
+    """Search for similar documents in Qdrant
+
+    With RETRIEVAL_MODE=hybrid and the question text, dense and BM25 results
+    are fused and "score" is the fused RRF score. filters ({field: [values]},
+    see build_filter) restrict both searches to matching chunks. hnsw_ef and
+    exact override the collection profile's dense search parameters. Returns
+    an empty list when the search fails or exceeds QDRANT_TIMEOUT.
+    """
+    client       = get_qdrant_client()
+    query_filter = build_filter (filters)
+    params       = search_params (
+        get_profile (settings.COLLECTION_PROFILE),
+        hnsw_ef = hnsw_ef or settings.QDRANT_HNSW_EF,
+        exact   = settings.QDRANT_EXACT_SEARCH if exact is None else exact,
+    )
+    try:
+        ranked = None
+        if settings.RETRIEVAL_MODE == "hybrid" and query_text and _sparse_available is not False:
+            ranked = await _hybrid_search (client, query_vector, query_text, limit, query_filter, params)
+
+        if ranked is None:
+            results = await _call (
+                client.search,
+                collection_name=settings.QDRANT_COLLECTION,
+                query_vector=query_vector,
+                query_filter=query_filter,
+                search_params=params,
+                limit=limit,
+                with_payload=_SEARCH_PAYLOAD
+            )
+            ranked = [(hit, hit.score) for hit in results]
+
         return [
             {
                 "id": hit.id,
-                "content": hit.payload.get("content", ""),
+                # The extractor stores chunk text under "text"
+                "content": hit.payload.get("text") or hit.payload.get("content", ""),
                 "source": hit.payload.get("source", ""),
-                "score": hit.score
+                "filename": hit.payload.get("filename"),
+                "file_hash": hit.payload.get("file_hash"),
+                "chunk_index": hit.payload.get("chunk_index"),
+                "char_start": hit.payload.get("char_start"),
+                "char_end": hit.payload.get("char_end"),
+                "score": score,
+                # Bumped whenever the point is rewritten; keys the answer cache
+                "version": hit.version
             }
-            for hit in results
+            for hit, score in ranked
         ]
 
+    except asyncio.TimeoutError:
+        logger.error(f"Qdrant search timed out after {settings.QDRANT_TIMEOUT}s")
+        return []
     except Exception as e:
         logger.error(f"Qdrant search error: {str(e)}")
         return []
 
+async def get_chunk(point_id: Any) -> Optional[Dict[str, Any]]:
+    """Fetch the full text and position of one chunk, e.g. to expand a citation"""
+    client = get_qdrant_client()
+    records = await _call (
+        client.retrieve,
+        collection_name=settings.QDRANT_COLLECTION,
+        ids=[point_id],
+        with_payload=_CHUNK_PAYLOAD,
+        with_vectors=False
+    )
+    if not records:
+        return None
+    return {"id": str(records[0].id), **records[0].payload}
+
 async def health_check() -> bool:
     """Check if Qdrant service is healthy"""
     try:
         client = get_qdrant_client()
-        loop = asyncio.get_event_loop()
         # Try to list collections to check health
-        await loop.run_in_executor(None, client.get_collections)
+        await _call (client.get_collections)
         return True
     except Exception as e:
         logger.error(f"Qdrant health check failed: {e}")
@@ -154,8 +306,7 @@ async def get_collection_info(collection_name: str = "documents") -> Optional[Di
     """Get information about a collection"""
     client = get_qdrant_client()
     try:
-        loop = asyncio.get_event_loop()
-        collection_info = await loop.run_in_executor(None, client.get_collection, collection_name)
+        collection_info = await _call (client.get_collection, collection_name)
 
         return {
             "name": collection_name,
@@ -169,7 +320,11 @@ async def get_collection_info(collection_name: str = "documents") -> Optional[Di
         return None
 
 async def close_qdrant_client():
-    """Close the Qdrant client"""
+    """Close the Qdrant client and its connection pool"""
     global _qdrant_client
     if _qdrant_client:
+        try:
+            await _qdrant_client.close()
+        except Exception as e:
+            logger.warning(f"Error closing Qdrant client: {e}")
         _qdrant_client = None
@@ -0,0 +1,76 @@
+# services/server/app/services/reranker.py
+import asyncio
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing             import Any, Dict, List, Optional
+from app.core.config    import settings
+
+logger = logging.getLogger (__name__)
+
+_model = None
+# One scoring job at a time caps the CPU the reranker can take from embedding
+_executor = ThreadPoolExecutor (max_workers=1, thread_name_prefix="rerank")
+# A timed-out job that was already scoring: threads can't be cancelled, so
+# reranking is skipped until it finishes instead of queueing behind it
+_abandoned: Optional[Future] = None
+
+
+def _load_model ():
+    global _model
+    if _model is None:
+        from sentence_transformers import CrossEncoder
+        logger.info (f"🔹 Loading reranker model: {settings.RERANK_MODEL}")
+        _model = CrossEncoder (settings.RERANK_MODEL, device="cpu", max_length=settings.RERANK_MAX_LENGTH)
+    return _model
+
+
+def _score (query: str, passages: List[str]) -> List[float]:
+    model  = _load_model ()
+    scores = model.predict (
+        [(query, passage) for passage in passages],
+        batch_size       =settings.RERANK_BATCH_SIZE,
+        show_progress_bar=False,
+    )
+    return [float (score) for score in scores]
+
+
+async def warm_up ():
+    """Load the cross-encoder and score one pair so the first request doesn't pay for it"""
+    loop = asyncio.get_running_loop ()
+    await loop.run_in_executor (_executor, _score, "warm up", ["warm up"])
+
+
+async def rerank (query: str, docs: List[Dict[str, Any]], top_k: int,
+                  budget_ms: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Re-order retrieved chunks with the cross-encoder and keep the best top_k.
+    Falls back to the retrieval order when scoring fails or exceeds the budget.
+    """
+    global _abandoned
+    if len (docs) <= 1:
+        return docs[:top_k]
+    if _abandoned is not None and not _abandoned.done ():
+        logger.warning ("Previous rerank still running past its budget; keeping retrieval order")
+        return docs[:top_k]
+
+    budget = (budget_ms or settings.RERANK_BUDGET_MS) / 1000
+    job    = _executor.submit (_score, query, [doc.get ("content", "") for doc in docs])
+    try:
+        # Shielded so the timeout does not cancel the job itself; that is decided below
+        scores = await asyncio.wait_for (asyncio.shield (asyncio.wrap_future (job)), budget)
+    except asyncio.TimeoutError:
+        # A job still queued is dropped; one already scoring blocks reranking until it ends
+        if not job.cancel ():
+            _abandoned = job
+        logger.warning (f"Reranking {len (docs)} chunks exceeded {budget * 1000:.0f} ms; keeping retrieval order")
+        return docs[:top_k]
+    except Exception as e:
+        logger.error (f"Reranking failed, keeping retrieval order: {e}")
+        return docs[:top_k]
+
+    ranked = sorted (zip (docs, scores), key=lambda pair: pair[1], reverse=True)[:top_k]
+    return [{**doc, "rerank_score": score} for doc, score in ranked]
+
+
+def close ():
+    _executor.shutdown (wait=False, cancel_futures=True)
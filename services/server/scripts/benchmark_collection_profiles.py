@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+# Load environment variables from .env one folder up
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.utils.qdrant_profiles import PROFILES, collection_config, search_params
+
+BENCH_PREFIX = "bench_profile_"
+
+
+def load_vectors(client: QdrantClient, collection: str, limit: int) -> np.ndarray:
+    """Dense vectors of up to limit points of an ingested collection"""
+    vectors, offset = [], None
+    while len(vectors) < limit:
+        records, offset = client.scroll(collection, limit=min(1000, limit - len(vectors)), offset=offset,
+                                        with_payload=False, with_vectors=True)
+        for record in records:
+            # Collections with sparse vectors return {"": dense, "bm25": sparse}
+            vector = record.vector.get("") if isinstance(record.vector, dict) else record.vector
+            if vector:
+                vectors.append(vector)
+        if offset is None:
+            break
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_collection(client: QdrantClient, name: str, profile_name: str, corpus: np.ndarray, timeout: float):
+    client.recreate_collection(
+        collection_name=name,
+        # Build the HNSW graph even for a small sample
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=10),
+        **collection_config(PROFILES[profile_name], corpus.shape[1])
+    )
+    client.upload_collection(name, vectors=corpus, ids=range(len(corpus)), batch_size=256, parallel=2, wait=True)
+
+    # Searches are only representative once the optimizer has built the index
+    deadline = time.monotonic() + timeout
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{name} still indexing after {timeout}s")
+        time.sleep(1)
+
+
+def run_queries(client: QdrantClient, name: str, queries: np.ndarray, truth: np.ndarray, top_k: int,
+                params: models.SearchParams):
+    """Recall@k against brute force, and per-query latencies in ms"""
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = client.search(name, query_vector=query.tolist(), limit=top_k, search_params=params,
+                               with_payload=False)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len({point.id for point in result} & set(expected.tolist()))
+    return hits / truth.size, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main():
+    """Report the recall/latency trade-off of each collection profile against a local Qdrant"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--url", default=os.getenv("QDRANT_URL", "http://localhost:6333"))
+    parser.add_argument("--collection", default=os.getenv("QDRANT_COLLECTION", "university_documents"),
+                        help="ingested collection the sample vectors are read from")
+    parser.add_argument("--sample", type=int, default=20000, help="points copied into each test collection")
+    parser.add_argument("--queries", type=int, default=200, help="held-out points used as queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ef", default="32,64,128,256", help="hnsw_ef values to try, besides the profile's")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--index-timeout", type=float, default=600)
+    parser.add_argument("--keep", action="store_true", help="keep the test collections")
+    args = parser.parse_args()
+
+    client = QdrantClient(args.url, prefer_grpc=True, timeout=60)
+
+    print(f"📥 Reading {args.sample + args.queries} vectors from {args.collection}...")
+    vectors = load_vectors(client, args.collection, args.sample + args.queries)
+    if len(vectors) <= args.queries:
+        print(f"❌ {args.collection} has only {len(vectors)} vectors")
+        sys.exit(1)
+    queries, corpus = vectors[:args.queries], vectors[args.queries:]
+
+    # Exact top-k by cosine (vectors are normalized); point IDs are row numbers
+    truth = np.argsort(-(queries @ corpus.T), axis=1)[:, :args.top_k]
+
+    print(f"{'profile':<10} {'hnsw_ef':>8} {'recall@' + str(args.top_k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for profile_name in args.profiles.split(","):
+        profile = PROFILES[profile_name]
+        name = BENCH_PREFIX + profile_name
+        build_collection(client, name, profile_name, corpus, args.index_timeout)
+
+        ef_values = sorted({int(ef) for ef in args.ef.split(",")} | ({profile.hnsw_ef} if profile.hnsw_ef else set()))
+        runs = [(str(ef), search_params(profile, hnsw_ef=ef)) for ef in ef_values]
+        runs.append(("exact", search_params(profile, exact=True)))
+        for label, params in runs:
+            recall, p50, p99 = run_queries(client, name, queries, truth, args.top_k, params)
+            marker = " ←" if label == str(profile.hnsw_ef) else ""
+            print(f"{profile_name:<10} {label:>8} {recall:>9.3f} {p50:>8.2f} {p99:>8.2f}{marker}")
+
+        if not args.keep:
+            client.delete_collection(name)
+
+    print("✅ Done (← marks each profile's default hnsw_ef)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables from .env one folder up
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), "..", ".env"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.embed_local import EMBEDDING_BACKENDS, check_backend_parity
+
+# Questions like the ones /chat receives, short and long, Italian and English
+SAMPLE_QUERIES = [
+    "test",
+    "orari segreteria",
+    "How do I register for the final exam of CS-214?",
+    "Quali documenti servono per l'iscrizione al primo anno della laurea magistrale?",
+    "What is the deadline for paying the second installment of tuition fees, and is there a late fee?",
+    "Vorrei sapere se posso sostenere l'esame di Analisi Matematica 1 nella sessione straordinaria "
+    "anche se non ho frequentato le lezioni del secondo semestre.",
+]
+
+
+def main():
+    """Check that an embedding backend reproduces the PyTorch query vectors"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=os.getenv("EMBEDDING_BACKEND", "onnx-int8"))
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    args = parser.parse_args()
+
+    print(f"🧪 Comparing {args.backend} embeddings against torch...")
+    parity = check_backend_parity(args.backend, SAMPLE_QUERIES)
+    print(f"📊 Cosine to torch: min {parity['min_cosine']:.5f}, mean {parity['mean_cosine']:.5f}")
+
+    if parity["min_cosine"] < args.min_cosine:
+        print(f"❌ {args.backend} drifts from torch (min cosine < {args.min_cosine})")
+        sys.exit(1)
+    print(f"✅ {args.backend} matches torch")
+
+
+if __name__ == "__main__":
+    main()